@@ -1,13 +1,89 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from core.agent import EcommerceAIAgent
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, conint
+from typing import List, Optional
+from core.cache import normalize_question
+from core.registry import AgentRegistry, UnknownTenant
+from core.concurrency import StageLimiter, StageSaturated
+from core.guard import QueryRejected
+from core.singleflight import CoalesceTimeout
+from utils.explanations import explain_summary
+from utils.stats import SummaryStats
+from utils.visualization import CHART_FORMATS, render_chart, warmup_charts
+from core.metrics import REQUEST_SECONDS, STAGE_SECONDS, current_timings, record, render_metric, request_scope, timed
 import pandas as pd
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
 
-app = FastAPI(title="E-commerce AI Agent API", version="1.0.0")
-agent = EcommerceAIAgent()
+def warm_agent():
+    try:
+        agent.warmup()
+        warmup_charts()
+    except Exception as e:
+        print(f"⚠️  WARNING: agent warmup failed, /health/ready stays unavailable: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Accept requests (and liveness probes) at once; every worker warms its own agent in the background
+    asyncio.get_running_loop().run_in_executor(None, warm_agent)
+    yield
+
+app = FastAPI(title="E-commerce AI Agent API", version="1.0.0", lifespan=lifespan)
+# Requests without a tenant go to DATABASE_PATH; the others to their own database under TENANT_DB_PATH
+registry = AgentRegistry(
+    os.getenv("DATABASE_PATH", "ecommerce_optimized.db"),
+    pattern=os.getenv("TENANT_DB_PATH") or None,
+    max_tenants=int(os.getenv("TENANT_MAX_AGENTS", "256")),
+    max_bytes=int(float(os.getenv("TENANT_MEMORY_MB", "1024")) * 1024 * 1024)
+)
+agent = registry.default
+
+llm_stage = StageLimiter(
+    "llm",
+    concurrency=int(os.getenv("LLM_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "64"))
+)
+sql_stage = StageLimiter(
+    "sql",
+    concurrency=int(os.getenv("SQL_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("SQL_MAX_QUEUE", "64"))
+)
+
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "10000"))
+MAX_STREAM_ROWS = int(os.getenv("MAX_STREAM_ROWS", "1000000"))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1000"))
+
+in_flight = 0
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Time every request, count it as in flight, and report its stage timings in a Server-Timing header"""
+    global in_flight
+    in_flight += 1
+    try:
+        with request_scope() as timings:
+            response = await call_next(request)
+    finally:
+        in_flight -= 1
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(route.path if route else "unmatched", time.perf_counter() - timings.started)
+    if timings.stages:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
 
 class QuestionRequest(BaseModel):
     question: str
+    tenant: Optional[str] = None
+    stream: bool = False
+    page_size: Optional[conint(ge=1)] = None
+    page_token: Optional[str] = None
 
 class AnswerResponse(BaseModel):
     question: str
@@ -15,6 +91,188 @@ class AnswerResponse(BaseModel):
     sql_query: str
     results: dict
     row_count: int
+    truncated: bool = False
+    next_page_token: Optional[str] = None
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+    tenant: Optional[str] = None
+    max_workers: Optional[conint(ge=1)] = None
+
+class BatchAnswer(BaseModel):
+    question: str
+    sql_query: str = ""
+    results: dict = {}
+    row_count: int = 0
+    truncated: bool = False
+    error: Optional[str] = None
+
+class BatchAnswerResponse(BaseModel):
+    answers: List[BatchAnswer]
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "100"))
+BATCH_FANOUT = int(os.getenv("BATCH_FANOUT", "8"))
+
+# Page tokens carry the SQL to run for the next page, so they are signed; serve.py hands one secret to all workers
+PAGE_TOKEN_SECRET = os.getenv("PAGE_TOKEN_SECRET", "").encode()
+if not PAGE_TOKEN_SECRET:
+    print("⚠️  WARNING: PAGE_TOKEN_SECRET is not set; page tokens only work on this process until it restarts")
+    PAGE_TOKEN_SECRET = secrets.token_bytes(32)
+
+def serialize_results(df):
+    if df is None or df.empty:
+        return {"data": {}}
+    with timed('serialize'):
+        return {"data": df.to_dict('records')}
+
+def encode_page_token(sql_query, offset, page_size, version, tenant=None):
+    payload = json.dumps({'sql': sql_query, 'offset': offset, 'page_size': page_size, 'version': list(version),
+                          'tenant': tenant}).encode()
+    signature = hmac.new(PAGE_TOKEN_SECRET, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(payload).decode() + "." + base64.urlsafe_b64encode(signature).decode()
+
+def decode_page_token(token, tenant=None):
+    try:
+        encoded, _, signature = token.partition(".")
+        payload = base64.urlsafe_b64decode(encoded.encode())
+        expected = hmac.new(PAGE_TOKEN_SECRET, payload, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, base64.urlsafe_b64decode(signature.encode())):
+            raise ValueError("bad page_token signature")
+        payload = json.loads(payload)
+        if payload.get('tenant') != tenant:
+            raise ValueError("page_token belongs to another tenant")
+        offset, page_size = int(payload['offset']), int(payload['page_size'])
+        if offset < 0 or page_size < 1:
+            raise ValueError("page_token window out of range")
+        return payload['sql'], offset, min(page_size, MAX_RESULT_ROWS), tuple(payload['version'])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid page_token")
+
+async def shared_sql(agent, question):
+    """Generate SQL on the LLM stage; identical questions in flight wait for it on the loop, not in a stage slot"""
+    return await agent.generation_requests.do(normalize_question(question),
+                                              lambda: llm_stage.run(agent.generate_sql, question),
+                                              agent.coalesce_timeout)
+
+async def shared_run(agent, key, func, *args):
+    """Run a query on the SQL stage once per key among concurrent requests"""
+    return await agent.execution_requests.do(key, lambda: sql_stage.run(func, *args), agent.coalesce_timeout)
+
+def flight_stats(agent):
+    """Coalescing counts of the API's event loop and of the agent's own threads (Streamlit, batches)"""
+    flights = {}
+    for stage, threads, requests in (('llm', agent.generation, agent.generation_requests),
+                                     ('sql', agent.execution, agent.execution_requests)):
+        a, b = threads.stats(), requests.stats()
+        flights[stage] = {key: a[key] + b[key] for key in a}
+    return flights
+
+async def data_version(agent):
+    """The agent's current data version; part of every execution key so no request joins a run on older data.
+
+    It is only read from the database (on the SQL stage) after the database files changed.
+    """
+    version = agent.known_data_version()
+    if version is None:
+        version = await shared_run(agent, ('version',), agent.current_data_version)
+    return version
+
+async def answer_batch(agent, questions, max_workers):
+    """agent.query_many with each generation and query run on the shared LLM and SQL stages.
+
+    The batch's own threads only wait for the event loop, so they hold no stage slot.
+    """
+    loop = asyncio.get_running_loop()
+    version = await data_version(agent)
+
+    def on_loop(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    return await asyncio.to_thread(
+        agent.query_many, questions, max_workers,
+        generate=lambda question: on_loop(shared_sql(agent, question)),
+        execute=lambda sql_query: on_loop(shared_run(agent, ('fetch', sql_query, version), agent.fetch_guarded, sql_query))
+    )
+
+def total_flight_stats(agents):
+    """flight_stats summed over the default agent and every loaded tenant agent"""
+    total = {}
+    for a in agents:
+        for stage, counts in flight_stats(a).items():
+            total[stage] = {key: total.get(stage, {}).get(key, 0) + value for key, value in counts.items()}
+    return total
+
+async def tenant_agent(tenant):
+    """The agent serving `tenant`; building one (or a due memory check) touches files, so that runs on the SQL stage"""
+    agent = registry.loaded(tenant)
+    if agent is not None:
+        return agent
+    try:
+        return await sql_stage.run(registry.get, tenant)
+    except UnknownTenant as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+class StageStreamingResponse(StreamingResponse):
+    """Streams while holding a stage slot taken before the response started; the slot is freed however the stream ends"""
+
+    def __init__(self, content, stage, **kwargs):
+        super().__init__(content, **kwargs)
+        self.stage = stage
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.stage.release()
+
+async def stream_ndjson(agent, question, sql_query, timings):
+    """Header line, one line per row (capped at MAX_STREAM_ROWS), then a trailer with the true row_count and an explanation.
+    The caller holds a sql_stage slot for the whole stream; rows are fetched on that stage's threads."""
+    yield json.dumps({'question': question, 'sql_query': sql_query}) + "\n"
+    row_count = 0
+    fetching, serializing, summarizing = 0.0, 0.0, 0.0
+    stats = SummaryStats()
+    chunks = agent.iter_rows(sql_query, STREAM_CHUNK_ROWS)
+    fetch = None
+    try:
+        while True:
+            started = time.perf_counter()
+            # shielded so a disconnect never abandons the cursor while a stage thread is reading from it
+            fetch = asyncio.ensure_future(sql_stage.call(next, chunks, None))
+            chunk = await asyncio.shield(fetch)
+            fetching += time.perf_counter() - started
+            if chunk is None:
+                break
+            columns, rows = chunk
+            started = time.perf_counter()
+            stats.update_rows(columns, rows)
+            summarizing += time.perf_counter() - started
+            sendable = rows[:max(MAX_STREAM_ROWS - row_count, 0)]
+            row_count += len(rows)
+            if sendable:
+                started = time.perf_counter()
+                lines = "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in sendable)
+                serializing += time.perf_counter() - started
+                yield lines
+    except QueryRejected as e:
+        yield json.dumps({'error': str(e), 'reason': e.reason}) + "\n"
+        return
+    except Exception as e:
+        yield json.dumps({'error': str(e)}) + "\n"
+        return
+    finally:
+        # hands the pooled connection back, after the last fetch if the client left while it was running
+        if fetch is not None and not fetch.done():
+            fetch.add_done_callback(lambda _: chunks.close())
+        else:
+            chunks.close()
+        record('sql', fetching, timings)
+        record('serialize', serializing, timings)
+    started = time.perf_counter()
+    answer = explain_summary(stats, question)
+    record('explanation', summarizing + time.perf_counter() - started, timings)
+    yield json.dumps({'row_count': row_count, 'truncated': row_count > MAX_STREAM_ROWS, 'answer': answer}) + "\n"
+    agent.log_if_slow(question, sql_query, timings)
 
 @app.get("/")
 async def root():
@@ -22,30 +280,215 @@ async def root():
 
 @app.post("/ask", response_model=AnswerResponse)
 async def ask_question(request: QuestionRequest):
+    timings = current_timings()
     try:
-        result = agent.query_database(request.question)
+        agent = await tenant_agent(request.tenant)
+        page_size = min(request.page_size or MAX_RESULT_ROWS, MAX_RESULT_ROWS)
+        offset = 0
+        version = await data_version(agent)
+        if request.page_token:
+            sql_query, offset, page_size, token_version = decode_page_token(request.page_token, request.tenant)
+            if token_version != version:
+                raise HTTPException(status_code=410, detail="Data was reloaded since this page_token was issued")
+        else:
+            sql_query = await shared_sql(agent, request.question)
+        
+        if request.stream:
+            if not (sql_query and sql_query.upper().startswith('SELECT')):
+                raise HTTPException(status_code=400, detail=f"Invalid SQL generated: {sql_query}")
+            await sql_stage.acquire()
+            return StageStreamingResponse(stream_ndjson(agent, request.question, sql_query, timings), sql_stage,
+                                          media_type="application/x-ndjson")
+        
+        result = await shared_run(agent, ('page', sql_query, offset, page_size, version),
+                                  agent.run_page, request.question, sql_query, offset, page_size)
         
+        if result.get('reason'):
+            raise HTTPException(status_code=422, detail=result['reason'])
         if result.get('error'):
             raise HTTPException(status_code=400, detail=result['error'])
         
-        results_dict = {}
-        if result.get('results') is not None and not result['results'].empty:
-            results_dict = result['results'].to_dict('records')
+        next_page_token = None
+        if result['next_offset'] is not None:
+            next_page_token = encode_page_token(sql_query, result['next_offset'], page_size, version, request.tenant)
         
         return AnswerResponse(
-            question=result['question'],
+            question=request.question,
             answer=result.get('answer', 'Query executed successfully'),
             sql_query=result['sql'],
-            results={"data": results_dict},
-            row_count=result['row_count']
+            results=serialize_results(result.get('results')),
+            row_count=result['row_count'],
+            truncated=next_page_token is not None,
+            next_page_token=next_page_token
         )
         
+    except HTTPException:
+        raise
+    except StageSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except CoalesceTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ask/batch", response_model=BatchAnswerResponse)
+async def ask_batch(request: BatchQuestionRequest):
+    if len(request.questions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} questions")
+    try:
+        agent = await tenant_agent(request.tenant)
+        results = await answer_batch(agent, request.questions, min(request.max_workers or BATCH_FANOUT, BATCH_FANOUT))
+    except StageSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    answers = []
+    for result in results:
+        if result.get('error'):
+            answers.append(BatchAnswer(question=result['question'], error=result['error']))
+        else:
+            answers.append(BatchAnswer(
+                question=result['question'],
+                sql_query=result['sql'],
+                results=serialize_results(result['results']),
+                row_count=result['row_count'],
+                truncated=result['truncated']
+            ))
+    return BatchAnswerResponse(answers=answers)
+
+CHART_TYPES = {'bar': "Bar Chart", 'pie': "Pie Chart"}
+
+@app.get("/chart")
+async def chart(request: Request, question: str, chart_type: str = "bar", format: str = "png",
+                tenant: Optional[str] = None):
+    """Render the answer to `question` as a chart image, served from the chart cache when the plotted data is unchanged"""
+    viz_type = CHART_TYPES.get(chart_type.lower())
+    if viz_type is None or format not in CHART_FORMATS:
+        raise HTTPException(status_code=400, detail=f"chart_type must be one of {sorted(CHART_TYPES)} and format one of {sorted(CHART_FORMATS)}")
+    try:
+        agent = await tenant_agent(tenant)
+        version = await data_version(agent)
+        sql_query = await shared_sql(agent, question)
+        result = await shared_run(agent, ('run', sql_query, version), agent.run_sql, question, sql_query)
+    except StageSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except CoalesceTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    if result.get('error'):
+        raise HTTPException(status_code=422 if result.get('reason') else 400, detail=result.get('reason') or result['error'])
+    
+    # A truncated result still charts: only its first rows are plotted
+    with timed('chart'):
+        key, image = await sql_stage.run(render_chart, result['results'], viz_type, format, agent.chart_cache)
+    if image is None:
+        raise HTTPException(status_code=422, detail=f"A {chart_type} chart does not fit this result")
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image, media_type=CHART_FORMATS[format], headers=headers)
+
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving; requests may still be slow until it is warm"""
+    return {"status": "live"}
+
+@app.get("/health/ready")
+async def readiness():
+    """503 until the agent has finished warming up"""
+    if not agent.warm:
+        return JSONResponse(status_code=503, content={"status": "warming"})
+    return {"status": "ready", "warmup_s": round(agent.warmup_seconds, 3)}
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "agent": "ready"}
+    return {
+        "status": "healthy",
+        "agent": "ready" if agent.warm else "warming",
+        "worker": os.getpid(),
+        "llm_backend": agent.llm.name,
+        "stages": {"llm": llm_stage.stats(), "sql": sql_stage.stats()},
+        "coalescing": total_flight_stats(registry.agents()),
+        "tenants": registry.stats()
+    }
+
+def cache_stats(agent):
+    caches = {'sql': agent.sql_cache.stats(), 'result': agent.result_cache.stats(), 'chart': agent.chart_cache.stats()}
+    if agent.intents is not None:
+        caches['intent'] = agent.intents.stats()
+    if agent.shared_cache is not None:
+        caches['shared'] = agent.shared_cache.stats()
+    return caches
+
+def tenant_label(agent):
+    """Labels of an agent's series: none for the default agent, so single-database setups look as before"""
+    return {} if agent.tenant is None else {'tenant': agent.tenant}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of stage latencies, cache effectiveness, load and LLM usage.
+
+    Per-agent series (caches, rewrites, guard, slow log, coalescing) carry a `tenant`
+    label for every loaded tenant agent; evicted tenants' series stop being reported.
+    """
+    agents = registry.agents()
+    caches = [(tenant_label(a), cache_stats(a)) for a in agents]
+    stages = {'llm': llm_stage.stats(), 'sql': sql_stage.stats()}
+    flights = [(tenant_label(a), flight_stats(a)) for a in agents]
+    usage = registry.llm_usage()
+    tenants = registry.stats()
+    sections = [
+        STAGE_SECONDS.render(),
+        REQUEST_SECONDS.render(),
+        render_metric("ecommerce_in_flight_requests", "gauge", "API requests currently being handled",
+                      [({}, in_flight)]),
+        render_metric("ecommerce_stage_running", "gauge", "Calls running in each limited stage",
+                      [({'stage': name}, s['running']) for name, s in stages.items()]),
+        render_metric("ecommerce_stage_waiting", "gauge", "Calls queued for each limited stage",
+                      [({'stage': name}, s['waiting']) for name, s in stages.items()]),
+        render_metric("ecommerce_cache_hit_ratio", "gauge", "Hit ratio of each cache since start",
+                      [(dict(labels, cache=name), round(s['hit_ratio'], 6)) for labels, c in caches for name, s in c.items()]),
+        render_metric("ecommerce_cache_hits_total", "counter", "Cache hits",
+                      [(dict(labels, cache=name), s['hits']) for labels, c in caches for name, s in c.items()]),
+        render_metric("ecommerce_cache_misses_total", "counter", "Cache misses",
+                      [(dict(labels, cache=name), s['misses']) for labels, c in caches for name, s in c.items()]),
+        render_metric("ecommerce_cache_entries", "gauge", "Entries held by each cache",
+                      [(dict(labels, cache=name), s['entries']) for labels, c in caches for name, s in c.items() if 'entries' in s]),
+        render_metric("ecommerce_result_cache_bytes", "gauge", "Memory held by cached query results",
+                      [(labels, c['result']['bytes']) for labels, c in caches]),
+        render_metric("ecommerce_chart_cache_bytes", "gauge", "Memory held by cached chart images",
+                      [(labels, c['chart']['bytes']) for labels, c in caches]),
+        render_metric("ecommerce_llm_calls_total", "counter", "SQL generation calls made to the LLM backend",
+                      [({'backend': agent.llm.name}, usage['calls'])]),
+        render_metric("ecommerce_llm_tokens_total", "counter", "LLM tokens used for SQL generation",
+                      [({'kind': 'prompt'}, usage['prompt_tokens']), ({'kind': 'completion'}, usage['completion_tokens'])]),
+        render_metric("ecommerce_llm_seconds_total", "counter", "Time spent waiting on the LLM backend",
+                      [({'backend': agent.llm.name}, round(usage['seconds'], 6))]),
+        render_metric("ecommerce_rollup_rewrites_total", "counter", "Queries answered from rollup tables",
+                      [(tenant_label(a), a.rewriter.stats()['rewrites']) for a in agents]),
+        render_metric("ecommerce_guard_queries_total", "counter", "Queries limited, flagged, rejected or aborted by the execution guard",
+                      [(dict(tenant_label(a), action=action), count) for a in agents for action, count in a.guard.stats().items()]),
+        render_metric("ecommerce_slow_queries_total", "counter", "Requests written to the slow-query log",
+                      [(tenant_label(a), a.slow_log.entries) for a in agents]),
+        render_metric("ecommerce_coalesced_requests_total", "counter", "Requests that waited for an identical LLM call or query already in flight",
+                      [(dict(labels, stage=name), f['coalesced']) for labels, fl in flights for name, f in fl.items()]),
+        render_metric("ecommerce_tenants_loaded", "gauge", "Tenant agents currently loaded (besides the default one)",
+                      [({}, tenants['tenants'])]),
+        render_metric("ecommerce_tenant_memory_bytes", "gauge", "Estimated memory of all loaded agents at the last budget check",
+                      [({}, tenants['memory_bytes'])]),
+        render_metric("ecommerce_tenant_agents_total", "counter", "Tenant agents built and evicted",
+                      [({'event': 'created'}, tenants['created']), ({'event': 'evicted'}, tenants['evicted'])]),
+        render_metric("ecommerce_coalesce_abandoned_total", "counter", "Coalesced waits that gave up before the shared call finished",
+                      [(dict(labels, stage=name, reason=reason), f[key]) for labels, fl in flights for name, f in fl.items()
+                       for reason, key in (('timeout', 'timeouts'), ('cancelled', 'cancelled'))]),
+    ]
+    columnar = [(tenant_label(a), a.columnar.stats()) for a in agents if a.columnar is not None]
+    if columnar:
+        sections.append(render_metric(
+            "ecommerce_columnar_queries_total", "counter", "Scan-heavy queries offered to the columnar engine",
+            [(dict(labels, engine=c['engine'], outcome=outcome), c[key]) for labels, c in columnar
+             for outcome, key in (('executed', 'queries'), ('fallback', 'fallbacks'))]
+        ))
+    return "\n".join(sections) + "\n"
 
 if __name__ == "__main__":
     import uvicorn
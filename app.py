@@ -2,7 +2,7 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 from core.agent import EcommerceAIAgent
-from ui.components import setup_page_config, create_sidebar, create_search_interface, display_results
+from ui.components import setup_page_config, create_sidebar, create_search_interface, display_results, stream_results
 from utils.explanations import generate_explanation
 from utils import visualization
 
@@ -18,23 +18,27 @@ def main():
     create_sidebar()
     search_query, search_button = create_search_interface()
     
-    if (search_button and search_query) or (st.session_state.get('search_query') and st.session_state.search_query != ""):
+    showing_answer = search_query and search_query == st.session_state.get('current_query')
+    if (search_button and search_query) or (st.session_state.get('search_query') and st.session_state.search_query != "") or showing_answer:
         if not search_query:
             search_query = st.session_state.search_query
             
         agent = get_agent()
         
-        with st.spinner(" Analyzing your data..."):
-            result = agent.query_database(search_query)
+        # Widget reruns (e.g. switching the chart type) redraw the stored answer instead of asking again
+        if not search_button and showing_answer and 'current_result' in st.session_state:
+            display_results(st.session_state.current_result, search_query, generate_explanation, visualization, agent.chart_cache)
+            return
+        
+        result = stream_results(agent.stream_answer(search_query), search_query, visualization, agent.chart_cache)
         
         if result.get('error'):
             st.error(f" Error: {result['error']}")
         else:
+            st.session_state.current_result = result
             st.session_state.current_results = result.get('results')
             st.session_state.current_query = search_query
             st.session_state.current_sql = result.get('sql')
-            
-            display_results(result, search_query, search_button, generate_explanation, visualization)
 
 if __name__ == "__main__":
     main()
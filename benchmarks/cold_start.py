@@ -0,0 +1,53 @@
+"""Cold start of one API worker, measured in a fresh interpreter.
+
+Times `import api`, the optional explicit warmup, the first answered question
+and the first chart rendered (for the first of the questions whose answer
+can be drawn as a bar chart), and prints them as one JSON document. Run by
+benchmarks.run once per sample so every measurement starts with empty module
+and page caches in the process; it can also be run by hand:
+
+    DATABASE_PATH=bench.db LLM_BACKEND=stub python -m benchmarks.cold_start --warm "Top 5 products by sales"
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", nargs="+")
+    parser.add_argument("--warm", action="store_true", help="run the worker warmup before the first request")
+    args = parser.parse_args()
+
+    timings = {}
+    with contextlib.redirect_stdout(sys.stderr):
+        started = time.perf_counter()
+        import api
+        timings['import_api'] = time.perf_counter() - started
+        if args.warm:
+            started = time.perf_counter()
+            api.warm_agent()
+            timings['warmup'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = api.agent.query_database(args.questions[0])
+        timings['first_request'] = time.perf_counter() - started
+        timings['error'] = result.get('error')
+
+        from utils.visualization import get_visualization_options, render_chart
+
+        for question in args.questions:
+            result = api.agent.query_database(question)
+            if not result.get('error') and "Bar Chart" in get_visualization_options(result['results']):
+                started = time.perf_counter()
+                render_chart(result['results'], "Bar Chart", "png")
+                timings['first_chart'] = time.perf_counter() - started
+                break
+        api.agent.pool.dispose()
+    print(json.dumps(timings))
+
+
+if __name__ == "__main__":
+    main()
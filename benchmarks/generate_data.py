@@ -0,0 +1,96 @@
+"""Write synthetic total_sales.csv, ad_sales.csv and eligibility.csv shaped like the files in data/.
+
+Scale 1 is roughly the size of the bundled sample (340 items over 14 days);
+scale multiplies the number of items, --days stretches the date range.
+
+    python -m benchmarks.generate_data --scale 100 --out /tmp/bench_data
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+BASE_ITEMS = 340
+BASE_DAYS = 14
+SELLING_SHARE = 0.2   # fraction of items with an order on a given day
+ADVERTISED_SHARE = 0.78
+ELIGIBLE_SHARE = 0.85
+INELIGIBLE_MESSAGES = [
+    "This product's cost to Amazon does not allow us to meet customers’ pricing expectations. "
+    "Consider reducing the cost. It may take a few weeks for your product to become eligible "
+    "to advertise after you reduce the cost.",
+    "This product is either missing important information or contains incorrect information. "
+    "Review in your product inventory.",
+]
+
+
+def generate(out_dir, scale=1.0, days=BASE_DAYS, seed=0, start=date(2025, 6, 1)):
+    """Generate the three CSV sources into out_dir and return their row counts"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    items = max(1, int(BASE_ITEMS * scale))
+    item_ids = np.arange(items)
+    prices = np.round(rng.lognormal(4.2, 0.9, items), 2)
+    advertised = item_ids[: max(1, int(items * ADVERTISED_SHARE))]
+    cpc = rng.uniform(0.5, 3.0, len(advertised))
+
+    paths = {name: os.path.join(out_dir, f"{name}.csv") for name in ('total_sales', 'ad_sales', 'eligibility')}
+    counts = dict.fromkeys(paths, 0)
+    for day_index in range(days):
+        day = (start + timedelta(days=day_index)).isoformat()
+        first = day_index == 0
+
+        selling = np.sort(rng.choice(item_ids, max(1, int(items * SELLING_SHARE)), replace=False))
+        units = np.maximum(1, rng.lognormal(1.0, 1.2, len(selling)).astype(int))
+        units[rng.random(len(selling)) < 0.01] *= -1  # returns
+        sales = pd.DataFrame({
+            'date': day,
+            'item_id': selling,
+            'total_sales': np.round(units * prices[selling], 2),
+            'total_units_ordered': units,
+        })
+        sales.to_csv(paths['total_sales'], mode='w' if first else 'a', header=first, index=False)
+        counts['total_sales'] += len(sales)
+
+        impressions = rng.lognormal(5.5, 1.8, len(advertised)).astype(int)
+        clicks = rng.binomial(impressions, 0.008)
+        units_sold = rng.binomial(clicks, 0.1)
+        ads = pd.DataFrame({
+            'date': day,
+            'item_id': advertised,
+            'ad_sales': np.round(units_sold * prices[advertised], 2),
+            'impressions': impressions,
+            'ad_spend': np.round(clicks * cpc, 2),
+            'clicks': clicks,
+            'units_sold': units_sold,
+        })
+        ads.to_csv(paths['ad_sales'], mode='w' if first else 'a', header=first, index=False)
+        counts['ad_sales'] += len(ads)
+
+        # one eligibility snapshot per day, timestamped like the source export (hours not zero-padded)
+        if day_index < days - 1:
+            eligible = rng.random(items) < ELIGIBLE_SHARE
+            messages = np.where(eligible, "", np.array(INELIGIBLE_MESSAGES)[rng.integers(0, 2, items)])
+            seconds = rng.integers(0, 60, items)
+            eligibility = pd.DataFrame({
+                'eligibility_datetime_utc': [f"{day} 8:50:{s:02d}" for s in seconds],
+                'item_id': item_ids,
+                'eligibility': np.where(eligible, "TRUE", "FALSE"),
+                'message': messages,
+            })
+            eligibility.to_csv(paths['eligibility'], mode='w' if first else 'a', header=first, index=False)
+            counts['eligibility'] += len(eligibility)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=10, help="multiple of the sample's item count")
+    parser.add_argument("--days", type=int, default=BASE_DAYS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_data")
+    args = parser.parse_args()
+    for name, rows in generate(args.out, args.scale, args.days, args.seed).items():
+        print(f"{name}: {rows} rows")
@@ -0,0 +1,83 @@
+"""HTTP load test against a running API, to compare throughput across worker counts.
+
+Replays benchmarks/questions.txt against POST /ask from `--concurrency` client
+threads for `--seconds` and prints one JSON document with latency percentiles,
+throughput and status counts. Run it once per `serve.py --workers N` setting.
+
+    python serve.py --workers 4 --port 8000
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 32 --seconds 30
+"""
+import argparse
+import collections
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.run import QUESTIONS_PATH, Stage, load_questions
+
+
+def worker(url, questions, deadline, stage, statuses, lock):
+    session = requests.Session()
+    for question in questions:
+        if time.perf_counter() >= deadline:
+            return
+        started = time.perf_counter()
+        try:
+            status = session.post(f"{url}/ask", json={'question': question}, timeout=60).status_code
+        except requests.RequestException:
+            status = 'error'
+        elapsed = time.perf_counter() - started
+        with lock:
+            stage.latencies.append(elapsed)
+            statuses[status] += 1
+            if status != 200:
+                stage.errors += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    workers = {requests.get(f"{args.url}/health", timeout=10).json().get('worker') for _ in range(4 * args.concurrency)}
+    stage = Stage("load")
+    statuses = collections.Counter()
+    lock = threading.Lock()
+    with stage.running():
+        deadline = time.perf_counter() + args.seconds
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for offset in range(args.concurrency):
+                # each client walks the corpus from its own starting point
+                order = itertools.islice(itertools.cycle(questions), offset, None)
+                executor.submit(worker, args.url, order, deadline, stage, statuses, lock)
+
+    summary = stage.summary()
+    summary['statuses'] = {str(status): count for status, count in statuses.items()}
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'url': args.url,
+            'concurrency': args.concurrency,
+            'seconds': args.seconds,
+            'workers_seen': len(workers),
+        },
+        'stages': {'load': summary},
+    }
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""End-to-end benchmark: data pipeline, question answering, explanations and charts.
+
+Generates synthetic CSVs, times EcommerceDataProcessor.run_full_pipeline, then
+replays benchmarks/questions.txt through EcommerceAIAgent.query_database with
+the offline stub LLM and feeds every result to generate_explanation and
+create_visualization. Prints one JSON document with p50/p95/p99 latency,
+throughput and peak memory per stage. With --columnar it also exports a Parquet
+snapshot and compares full-history aggregates on SQLite and the columnar engine.
+
+    python -m benchmarks.run --scale 100 --rounds 5 --output bench_scale100.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate_data import generate
+from data.processor import EcommerceDataProcessor, peak_rss_mb
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "questions.txt")
+
+# Full-history aggregates that scan the daily tables, for --columnar
+ANALYTIC_QUERIES = [
+    "SELECT AVG(ctr) FROM daily_ad_performance",
+    "SELECT AVG(roas) AS avg_roas, AVG(cpc) AS avg_cpc, AVG(ctr) AS avg_ctr FROM daily_ad_performance WHERE clicks > 0",
+    "SELECT item_id, AVG(ctr) AS avg_ctr FROM daily_ad_performance WHERE impressions > 0 "
+    "GROUP BY item_id ORDER BY avg_ctr DESC LIMIT 10",
+    "SELECT date, SUM(ad_sales) AS ad_sales, SUM(ad_spend) AS ad_spend FROM daily_ad_performance GROUP BY date ORDER BY date",
+    "SELECT item_id, SUM(total_sales) AS sales FROM daily_sales GROUP BY item_id ORDER BY sales DESC LIMIT 10",
+    "SELECT COUNT(*) FROM daily_ad_performance WHERE units_sold > 0",
+]
+
+
+def load_questions(path=QUESTIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+class Stage:
+    """Collects per-call latencies and errors for one stage"""
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.latencies = []
+        self.errors = 0
+        self.wall = 0.0
+        self.peak_traced_mb = None
+
+    @contextlib.contextmanager
+    def running(self):
+        """Wrap the whole stage to measure wall time and peak memory"""
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall += time.perf_counter() - started
+            if self.trace_memory:
+                self.peak_traced_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+
+    def call(self, func, *args):
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            self.errors += 1
+            result = None
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    def summary(self):
+        latencies = np.array(self.latencies) * 1000
+        summary = {
+            'calls': len(latencies),
+            'errors': self.errors,
+            'wall_s': round(self.wall, 4),
+            'throughput_per_s': round(len(latencies) / self.wall, 2) if self.wall else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_traced_mb': self.peak_traced_mb,
+        }
+        if len(latencies):
+            summary.update({
+                'mean_ms': round(float(latencies.mean()), 3),
+                'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+                'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+                'max_ms': round(float(latencies.max()), 3),
+            })
+        return summary
+
+
+def run_pipeline(data_dir, db_path, runs, trace_memory, snapshot_dir=None):
+    stage = Stage("pipeline", trace_memory)
+    ingest = None
+    with stage.running():
+        for _ in range(runs):
+            processor = EcommerceDataProcessor(db_path, data_dir=data_dir, snapshot_dir=snapshot_dir)
+            stage.call(processor.run_full_pipeline)
+            ingest = processor.ingest_stats
+            processor.conn.close()
+    summary = stage.summary()
+    if ingest:
+        summary['rows'] = ingest['rows']
+        summary['rows_per_sec'] = round(ingest['rows_per_sec'], 1)
+    return summary
+
+
+def replay(stage, agent, questions, concurrency):
+    with stage.running():
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(lambda q: stage.call(agent.query_database, q), questions))
+
+
+def run_queries(db_path, questions, rounds, concurrency, trace_memory):
+    """Replay the corpus `rounds` times; the first round runs with empty caches"""
+    from core.agent import EcommerceAIAgent
+
+    agent = EcommerceAIAgent(db_path)
+    cold = Stage("query_cold", trace_memory)
+    results = replay(cold, agent, questions, concurrency)
+    warm = Stage("query_warm", trace_memory)
+    for _ in range(rounds - 1):
+        replay(warm, agent, questions, concurrency)
+
+    for result in results:
+        if result is None or result.get('error'):
+            cold.errors += 1
+    summaries = {'query_cold': cold.summary()}
+    if warm.latencies:
+        summaries['query_warm'] = warm.summary()
+    summaries['query_cold']['llm'] = dict(agent.llm_usage)
+    frames = [(r['question'], r['results']) for r in results if r and not r.get('error')]
+    agent.pool.dispose()
+    return summaries, frames
+
+
+def run_first_content(db_path, questions, trace_memory):
+    """Cold-cache streamed answers: time to the first SQL text, to the first rows, and to the full answer"""
+    from core.agent import EcommerceAIAgent
+
+    agent = EcommerceAIAgent(db_path)
+    stages = {name: Stage(name, trace_memory) for name in ("first_sql", "first_rows", "streamed_answer")}
+    with stages['streamed_answer'].running():
+        for question in questions:
+            started = time.perf_counter()
+            seen = set()
+            for event, payload in agent.stream_answer(question):
+                elapsed = time.perf_counter() - started
+                if event in ('sql_token', 'sql') and 'sql' not in seen:
+                    seen.add('sql')
+                    stages['first_sql'].latencies.append(elapsed)
+                elif event == 'rows' and 'rows' not in seen:
+                    seen.add('rows')
+                    stages['first_rows'].latencies.append(elapsed)
+                elif event == 'error':
+                    stages['streamed_answer'].errors += 1
+            stages['streamed_answer'].latencies.append(time.perf_counter() - started)
+    agent.pool.dispose()
+    for name in ("first_sql", "first_rows"):
+        stages[name].wall = stages['streamed_answer'].wall
+    return {name: stage.summary() for name, stage in stages.items()}
+
+
+def run_cold_start(db_path, questions, samples):
+    """Fresh worker processes: import time, explicit warmup, and the first request and chart with and without it"""
+    stages = {name: Stage(name) for name in
+              ("import_api", "warmup", "first_request_cold", "first_request_warm",
+               "first_chart_cold", "first_chart_warm")}
+    env = dict(os.environ, DATABASE_PATH=db_path)
+    for warm in (False, True):
+        for _ in range(samples):
+            command = [sys.executable, "-m", "benchmarks.cold_start", *questions] + (["--warm"] if warm else [])
+            started = time.perf_counter()
+            done = subprocess.run(command, env=env, capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            wall = time.perf_counter() - started
+            first = stages['first_request_warm' if warm else 'first_request_cold']
+            first.wall += wall
+            if done.returncode != 0:
+                first.errors += 1
+                print(done.stderr[-2000:])
+                continue
+            timings = json.loads(done.stdout.strip().splitlines()[-1])
+            stages['import_api'].latencies.append(timings['import_api'])
+            if warm:
+                stages['warmup'].latencies.append(timings['warmup'])
+            first.latencies.append(timings['first_request'])
+            first.errors += bool(timings['error'])
+            if 'first_chart' in timings:
+                stages['first_chart_warm' if warm else 'first_chart_cold'].latencies.append(timings['first_chart'])
+    for name in ("import_api", "warmup", "first_chart_cold", "first_chart_warm"):
+        stages[name].wall = stages['first_request_cold'].wall + stages['first_request_warm'].wall
+    return {name: stage.summary() for name, stage in stages.items() if stage.latencies or stage.errors}
+
+
+def run_explanations(frames, rounds, trace_memory, chunk_rows=1000):
+    """Explain each full result, and again fed in chunks as the NDJSON stream does"""
+    from utils.explanations import explain_summary, generate_explanation
+    from utils.stats import SummaryStats
+
+    def explain_in_chunks(df, question):
+        stats = SummaryStats()
+        for start in range(0, max(len(df), 1), chunk_rows):
+            stats.update(df.iloc[start:start + chunk_rows])
+        return explain_summary(stats, question)
+
+    summaries = {}
+    for name, explain in (("explanation", generate_explanation), ("explanation_chunked", explain_in_chunks)):
+        stage = Stage(name, trace_memory)
+        with stage.running():
+            for _ in range(rounds):
+                for question, df in frames:
+                    stage.call(explain, df, question)
+        summaries[name] = stage.summary()
+    return summaries
+
+
+def run_visualizations(frames, rounds, trace_memory):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from utils.visualization import create_visualization, get_visualization_options
+
+    def render(df, viz_type):
+        fig = create_visualization(df, viz_type)
+        if fig is not None:
+            fig.canvas.draw()
+            plt.close(fig)
+
+    stage = Stage("visualization", trace_memory)
+    with stage.running():
+        for _ in range(rounds):
+            for _, df in frames:
+                for viz_type in get_visualization_options(df):
+                    stage.call(render, df, viz_type)
+    return stage.summary()
+
+
+def run_cached_charts(frames, rounds, trace_memory):
+    """PNG rendering through the chart cache, as the app and GET /chart do; rounds after the first are hits"""
+    from core.cache import ChartCache
+    from utils.visualization import get_visualization_options, render_chart
+
+    cache = ChartCache()
+    stage = Stage("chart_png", trace_memory)
+    with stage.running():
+        for _ in range(rounds):
+            for _, df in frames:
+                for viz_type in get_visualization_options(df):
+                    stage.call(render_chart, df, viz_type, "png", cache)
+    summary = stage.summary()
+    summary['cache'] = cache.stats()
+    return summary
+
+
+def run_analytics(db_path, snapshot_dir, rounds, trace_memory):
+    """Time ANALYTIC_QUERIES on SQLite and on the columnar engine; the first round of each only warms up"""
+    from core.columnar import create_columnar_engine
+
+    conn = sqlite3.connect(db_path)
+    version = (conn.execute("PRAGMA schema_version").fetchone()[0], conn.execute("PRAGMA user_version").fetchone()[0])
+    engine = create_columnar_engine(snapshot_dir, os.getenv("COLUMNAR_ENGINE", "auto"))
+
+    def on_sqlite(sql_query):
+        cursor = conn.execute(sql_query)
+        columns = [d[0] for d in cursor.description]
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns, coerce_float=True)
+
+    def on_columnar(sql_query):
+        df = engine.execute(sql_query, version)
+        if df is None:
+            raise RuntimeError(f"columnar engine declined: {sql_query}")
+        return df
+
+    summaries = {}
+    results = {}
+    for name, run in (("analytics_sqlite", on_sqlite), ("analytics_columnar", on_columnar)):
+        results[name] = [run(sql_query) for sql_query in ANALYTIC_QUERIES]
+        stage = Stage(name, trace_memory)
+        with stage.running():
+            for _ in range(rounds):
+                for sql_query in ANALYTIC_QUERIES:
+                    stage.call(run, sql_query)
+        summaries[name] = stage.summary()
+    conn.close()
+
+    mismatches = 0
+    for expected, actual in zip(results["analytics_sqlite"], results["analytics_columnar"]):
+        try:
+            pd.testing.assert_frame_equal(expected, actual, check_dtype=False, rtol=1e-9)
+        except AssertionError:
+            mismatches += 1
+    sqlite_s, columnar_s = summaries["analytics_sqlite"], summaries["analytics_columnar"]
+    columnar_s.update({
+        'engine': engine.name,
+        'mismatches': mismatches,
+        'speedup_p50': round(sqlite_s['p50_ms'] / columnar_s['p50_ms'], 2) if columnar_s.get('p50_ms') else None,
+        'speedup_total': round(sqlite_s['wall_s'] / columnar_s['wall_s'], 2) if columnar_s['wall_s'] else None,
+    })
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=10, help="multiple of the sample's item count")
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="reuse CSVs from this directory instead of generating them")
+    parser.add_argument("--workdir", help="keep generated CSVs and the database here (default: temp dir)")
+    parser.add_argument("--pipeline-runs", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the question corpus")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--stub-latency-ms", type=float, default=50)
+    parser.add_argument("--cold-starts", type=int, default=3, help="fresh worker processes per cold-start stage")
+    parser.add_argument("--columnar", action="store_true",
+                        help="export a Parquet snapshot and compare scan-heavy aggregates on SQLite and the columnar engine")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report per-stage peak Python allocations (slows every stage down)")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    # The stub keeps the run offline and deterministic; an explicit LLM_BACKEND still wins
+    os.environ.setdefault("LLM_BACKEND", "stub")
+    os.environ.setdefault("STUB_LATENCY_MS", str(args.stub_latency_ms))
+    os.environ.setdefault("STUB_SEED", str(args.seed))
+    os.environ.setdefault("SQL_CACHE_PATH", "")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ecommerce_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    data_dir = args.data_dir or os.path.join(workdir, "data")
+    db_path = os.path.join(workdir, "bench.db")
+    snapshot_dir = os.path.join(workdir, "snapshots") if args.columnar else None
+    if snapshot_dir:
+        os.environ["COLUMNAR_SNAPSHOT_DIR"] = snapshot_dir
+    questions = load_questions(args.questions)
+
+    stages = {}
+    # Progress output from the processor goes to stderr so stdout stays valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        rows = None
+        if not args.data_dir:
+            started = time.perf_counter()
+            rows = generate(data_dir, args.scale, args.days, args.seed)
+            print(f"Generated {sum(rows.values())} rows in {time.perf_counter() - started:.1f}s")
+        stages['pipeline'] = run_pipeline(data_dir, db_path, args.pipeline_runs, args.trace_memory, snapshot_dir)
+        if snapshot_dir:
+            stages.update(run_analytics(db_path, snapshot_dir, args.rounds, args.trace_memory))
+        query_stages, frames = run_queries(db_path, questions, args.rounds, args.concurrency, args.trace_memory)
+        stages.update(query_stages)
+        stages.update(run_first_content(db_path, questions, args.trace_memory))
+        if args.cold_starts:
+            stages.update(run_cold_start(db_path, questions, args.cold_starts))
+        stages.update(run_explanations(frames, args.rounds, args.trace_memory))
+        stages['visualization'] = run_visualizations(frames, args.rounds, args.trace_memory)
+        stages['chart_png'] = run_cached_charts(frames, args.rounds, args.trace_memory)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'days': args.days,
+            'seed': args.seed,
+            'csv_rows': rows,
+            'db_mb': round(os.path.getsize(db_path) / (1024 * 1024), 2),
+            'questions': len(questions),
+            'rounds': args.rounds,
+            'concurrency': args.concurrency,
+            'llm_backend': os.environ["LLM_BACKEND"],
+        },
+        'stages': stages,
+    }
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
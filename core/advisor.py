@@ -0,0 +1,310 @@
+"""Workload-driven index advisor.
+
+The agent records every statement it executes in a QueryLog. IndexAdvisor mines
+the most expensive recurring statement patterns, proposes composite or covering
+indexes for them, and validates each proposal inside a transaction that is
+rolled back, comparing EXPLAIN QUERY PLAN and measured latency before and after.
+
+    python -m core.advisor --log query_log.jsonl                 # report only
+    python -m core.advisor --log query_log.jsonl --apply         # create accepted indexes
+"""
+import argparse
+import atexit
+import collections
+import json
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+import weakref
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+KEYWORD = re.compile(r"\b(SELECT|FROM|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|ON|JOIN|UNION)\b", re.IGNORECASE)
+TABLE_REF = re.compile(
+    r"\b(?:FROM|JOIN)\s+(?P<table>\w+)"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|GROUP|ORDER|LIMIT|INNER|LEFT|CROSS|NATURAL|USING|HAVING|UNION)\b)(?P<alias>\w+))?",
+    re.IGNORECASE
+)
+COLUMN_REF = re.compile(r"(?:\b(?P<qualifier>\w+)\s*\.\s*)?\b(?P<column>[A-Za-z_]\w*)\b")
+EQUALITY = re.compile(r"^\s*(?:=|==|IN\b|IS\b)", re.IGNORECASE)
+RANGE = re.compile(r"^\s*(?:<=|>=|<|>|BETWEEN\b|LIKE\b|GLOB\b)", re.IGNORECASE)
+
+# Wider indexes cost more to maintain than they save on these tables
+MAX_INDEX_COLUMNS = 6
+
+# Log lines are appended in batches from a timer thread, at most this long after the statement ran
+QUERY_LOG_FLUSH_DELAY_S = 1.0
+
+
+def statement_pattern(sql_query):
+    """The statement with literals replaced by ? and whitespace collapsed, so repeated shapes share a key"""
+    return " ".join(LITERAL.sub("?", sql_query).split())
+
+
+class QueryLog:
+    """Executed statements aggregated by pattern, optionally appended to a JSON lines file.
+
+    Every statement goes to the file, buffered and appended off the request path;
+    in memory, at most `max_patterns` patterns are kept and the least recently
+    seen one makes room for a new one.
+    """
+
+    def __init__(self, path=None, max_patterns=1000, flush_delay=QUERY_LOG_FLUSH_DELAY_S):
+        self.path = path
+        self.max_patterns = max_patterns
+        self.flush_delay = flush_delay
+        self.patterns = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Keeps batches in order when a flush overlaps the timer's
+        self._write_lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+        if path:
+            atexit.register(_flush_at_exit, weakref.ref(self))
+
+    def record(self, sql_query, seconds, rows=None):
+        with self._lock:
+            self._aggregate(sql_query, seconds)
+            if self.path:
+                self._pending.append({'ts': time.time(), 'sql': sql_query, 'ms': round(seconds * 1000, 3), 'rows': rows})
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_delay, self._write_pending)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def _aggregate(self, sql_query, seconds):
+        pattern = statement_pattern(sql_query)
+        entry = self.patterns.get(pattern)
+        if entry is None:
+            if len(self.patterns) >= self.max_patterns:
+                self.patterns.popitem(last=False)
+            entry = self.patterns[pattern] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sample': sql_query}
+        else:
+            self.patterns.move_to_end(pattern)
+        ms = seconds * 1000
+        entry['count'] += 1
+        entry['total_ms'] += ms
+        entry['max_ms'] = max(entry['max_ms'], ms)
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._lock:
+                self._timer = None
+                entries, self._pending = self._pending, []
+            if not entries:
+                return
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            except OSError as e:
+                print(f"⚠️  WARNING: could not append {len(entries)} statements to query log {self.path}: {e}")
+
+    def flush(self):
+        """Append statements still waiting for the timer now (at exit, or when the agent closes)"""
+        with self._lock:
+            timer = self._timer
+        if timer is not None:
+            timer.cancel()
+        self._write_pending()
+
+    def load(self, path):
+        """Replay a JSON lines log written by `record` (without appending to it again)"""
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    with self._lock:
+                        self._aggregate(entry['sql'], entry['ms'] / 1000)
+
+    def top(self, limit=10, min_count=2):
+        """The most expensive recurring patterns by total time"""
+        with self._lock:
+            entries = [dict(entry, pattern=pattern) for pattern, entry in self.patterns.items()]
+        entries = [entry for entry in entries if entry['count'] >= min_count]
+        return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'patterns': len(self.patterns),
+                'statements': sum(entry['count'] for entry in self.patterns.values()),
+            }
+
+
+def _flush_at_exit(ref):
+    query_log = ref()
+    if query_log is not None:
+        query_log.flush()
+
+
+class IndexAdvisor:
+    def __init__(self, db_path, query_log, runs=5, min_gain=0.1):
+        self.db_path = db_path
+        self.query_log = query_log
+        self.runs = runs
+        self.min_gain = min_gain
+
+    def connect(self):
+        # autocommit mode so validate() controls the transaction it rolls back
+        return sqlite3.connect(self.db_path, isolation_level=None)
+
+    def table_columns(self, conn):
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        return {table: [col[1] for col in conn.execute(f'PRAGMA table_info("{table}")')] for table in tables}
+
+    def existing_indexes(self, conn, table):
+        indexes = []
+        for index in conn.execute(f'PRAGMA index_list("{table}")'):
+            columns = [col[2] for col in conn.execute(f'PRAGMA index_info("{index[1]}")')]
+            indexes.append(columns)
+        return indexes
+
+    def analyze(self, sql_query, columns):
+        """Per referenced table: equality, join, range, group, order and all used columns"""
+        aliases = {}
+        for ref in TABLE_REF.finditer(sql_query):
+            table = ref.group('table')
+            if table in columns:
+                aliases[table.lower()] = table
+                if ref.group('alias'):
+                    aliases[ref.group('alias').lower()] = table
+        tables = sorted(set(aliases.values()))
+        usage = {table: {'equality': [], 'join': [], 'range': [], 'group': [], 'order': [], 'used': []} for table in tables}
+
+        def resolve(match):
+            qualifier, column = match.group('qualifier'), match.group('column')
+            if qualifier:
+                table = aliases.get(qualifier.lower())
+                return (table, column) if table and column in columns[table] else None
+            owners = [table for table in tables if column in columns[table]]
+            return (owners[0], column) if len(owners) == 1 else None
+
+        def add(table, kind, column):
+            if column not in usage[table][kind]:
+                usage[table][kind].append(column)
+
+        text = LITERAL.sub("0", sql_query)
+        keywords = list(KEYWORD.finditer(text))
+        for i, keyword in enumerate(keywords):
+            clause = " ".join(keyword.group(1).upper().split())
+            segment = text[keyword.end():keywords[i + 1].start() if i + 1 < len(keywords) else len(text)]
+            for match in COLUMN_REF.finditer(segment):
+                resolved = resolve(match)
+                if resolved is None:
+                    continue
+                table, column = resolved
+                add(table, 'used', column)
+                following = segment[match.end():]
+                preceding = segment[:match.start()].rstrip()
+                if clause == 'ON' and (EQUALITY.match(following) or preceding.endswith('=')):
+                    add(table, 'join', column)
+                elif clause in ('WHERE', 'ON'):
+                    if EQUALITY.match(following):
+                        add(table, 'equality', column)
+                    elif RANGE.match(following):
+                        add(table, 'range', column)
+                elif clause == 'GROUP BY':
+                    add(table, 'group', column)
+                elif clause == 'ORDER BY':
+                    add(table, 'order', column)
+        return usage
+
+    def candidates(self, conn, patterns):
+        """Propose one index per (table, leading columns), merging the patterns it would serve"""
+        columns = self.table_columns(conn)
+        proposals = {}
+        for entry in patterns:
+            for table, use in self.analyze(entry['sample'], columns).items():
+                # constant filters lead, then join keys, then one range or the grouping/ordering columns
+                key = use['equality'] + [c for c in use['join'] if c not in use['equality']]
+                if use['range']:
+                    key.append(use['range'][0])
+                else:
+                    key += [c for c in use['group'] or use['order'] if c not in key]
+                if not key:
+                    continue
+                extra = [c for c in use['used'] if c not in key]
+                index_columns = key + extra if len(key) + len(extra) <= MAX_INDEX_COLUMNS else key
+                if any(existing[:len(index_columns)] == index_columns for existing in self.existing_indexes(conn, table)):
+                    continue
+                name = f"idx_adv_{table}_{'_'.join(index_columns)}"[:120]
+                proposal = proposals.setdefault(name, {
+                    'name': name,
+                    'table': table,
+                    'columns': index_columns,
+                    'covering': len(index_columns) > len(key),
+                    'statement': f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(index_columns)})",
+                    'patterns': [],
+                })
+                proposal['patterns'].append(entry)
+        return list(proposals.values())
+
+    def measure(self, conn, sql_query):
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_query}")]
+        timings = []
+        for _ in range(self.runs):
+            started = time.perf_counter()
+            conn.execute(sql_query).fetchall()
+            timings.append(time.perf_counter() - started)
+        return plan, statistics.median(timings) * 1000
+
+    def validate(self, conn, proposal):
+        """Build the index inside a transaction, compare plans and latency, then roll back"""
+        samples = [entry['sample'] for entry in proposal['patterns']]
+        before = [self.measure(conn, sql_query) for sql_query in samples]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(proposal['statement'])
+            after = [self.measure(conn, sql_query) for sql_query in samples]
+        finally:
+            conn.execute("ROLLBACK")
+
+        # weight each pattern by how often it runs
+        weights = [entry['count'] for entry in proposal['patterns']]
+        before_ms = sum(ms * w for (_, ms), w in zip(before, weights))
+        after_ms = sum(ms * w for (_, ms), w in zip(after, weights))
+        used = any(proposal['name'] in line for plan, _ in after for line in plan)
+        proposal.update({
+            'plan_before': [plan for plan, _ in before],
+            'plan_after': [plan for plan, _ in after],
+            'before_ms': round(before_ms, 3),
+            'after_ms': round(after_ms, 3),
+            'accepted': used and after_ms < before_ms * (1 - self.min_gain),
+        })
+        return proposal
+
+    def advise(self, limit=10, min_count=2):
+        """Validated proposals for the top recurring patterns, best improvement first"""
+        patterns = self.query_log.top(limit, min_count)
+        conn = self.connect()
+        try:
+            proposals = [self.validate(conn, proposal) for proposal in self.candidates(conn, patterns)]
+        finally:
+            conn.close()
+        return sorted(proposals, key=lambda p: p['before_ms'] - p['after_ms'], reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Propose and validate indexes from a query log")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "ecommerce_optimized.db"))
+    parser.add_argument("--log", default=os.getenv("QUERY_LOG_PATH", "query_log.jsonl"))
+    parser.add_argument("--top", type=int, default=10, help="patterns to consider")
+    parser.add_argument("--min-count", type=int, default=2, help="ignore patterns seen fewer times")
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per query before and after")
+    parser.add_argument("--apply", action="store_true", help="create accepted indexes via EcommerceDataProcessor")
+    args = parser.parse_args()
+
+    log = QueryLog()
+    log.load(args.log)
+    proposals = IndexAdvisor(args.db, log, runs=args.runs).advise(args.top, args.min_count)
+    for proposal in proposals:
+        status = "accept" if proposal['accepted'] else "reject"
+        print(f"[{status}] {proposal['statement']}: {proposal['before_ms']:.2f} ms -> {proposal['after_ms']:.2f} ms "
+              f"over {len(proposal['patterns'])} pattern(s)")
+
+    accepted = [p['statement'] for p in proposals if p['accepted']]
+    if args.apply and accepted:
+        from data.processor import EcommerceDataProcessor
+        EcommerceDataProcessor(args.db, snapshot_dir=os.getenv("COLUMNAR_SNAPSHOT_DIR") or None).apply_indexes(accepted)
@@ -1,36 +1,30 @@
-from langchain_groq import ChatGroq
-from langchain_community.utilities import SQLDatabase
-from langchain_experimental.sql import SQLDatabaseChain
-from langchain.prompts import PromptTemplate
-import sqlite3
 import pandas as pd
+import contextlib
+import logging
 import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from core.cache import SQLCache, ResultCache, ChartCache, normalize_question, schema_fingerprint
+from core.shared_cache import SharedCacheStore
+from core.pool import ReadOnlyPool
+from core.rewrite import RollupRewriter
+from core.intents import IntentMatcher
+from core.schema import SchemaContext
+from core.llm import create_backend
+from core.advisor import QueryLog
+from core.columnar import create_columnar_engine
+from core.guard import ExecutionGuard, QueryRejected
+from core.metrics import SlowQueryLog, current_timings, record, request_scope, timed
+from core.singleflight import Abandoned, AsyncSingleFlight, SingleFlight
+from utils.stats import SummaryStats
+from utils.explanations import explain_summary
 
-class EcommerceAIAgent:
-    def __init__(self, db_path="ecommerce_optimized.db"):
-        load_dotenv()
-        self.db_path = db_path
-        self.setup_components()
-        
-    def setup_components(self):
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            print("⚠️  WARNING: GROQ_API_KEY not found in .env file")
-            print("   Create a .env file with: GROQ_API_KEY=your_key_here")
-        
-        self.llm = ChatGroq(
-            model_name="llama-3.1-8b-instant", 
-            temperature=0,
-            max_tokens=150,
-            groq_api_key=groq_api_key
-        )
-        
-        self.db = SQLDatabase.from_uri(f"sqlite:///{self.db_path}")
-        
-        sql_prompt = PromptTemplate(
-            input_variables=["input", "table_info", "dialect"],
-            template="""Given an input question, create a syntactically correct {dialect} query to run.
+logger = logging.getLogger(__name__)
+
+SQL_PROMPT = """Given an input question, create a syntactically correct {dialect} query to run.
 
 DATABASE SCHEMA:
 {table_info}
@@ -45,47 +39,619 @@ INSTRUCTIONS:
 
 Question: {input}
 SQLQuery:"""
+
+# Rendered during warmup so the first real questions find the prompt and schema caches built
+WARMUP_QUESTIONS = [
+    "What is my total sales?",
+    "Calculate the average Return on Ad Spend",
+    "Which products have the highest click-through rate?",
+]
+
+# Per-agent overhead memory_bytes() does not measure: schema context, bookkeeping, SQLite connection state
+AGENT_BASE_BYTES = 1024 * 1024
+
+def tenant_path(path, tenant):
+    """Per-tenant variant of a configured file or directory: `{tenant}` is filled in, else the id goes before the extension"""
+    if not path or tenant is None:
+        return path
+    if "{tenant}" in path:
+        return path.replace("{tenant}", tenant)
+    root, ext = os.path.splitext(path)
+    return f"{root}.{tenant}{ext}"
+
+class EcommerceAIAgent:
+    def __init__(self, db_path="ecommerce_optimized.db", llm=None, tenant=None):
+        load_dotenv()
+        self.db_path = db_path
+        self.tenant = tenant
+        # Agents of different tenants may share the LLM client, never files built from one database
+        self.llm = llm
+        # Worker processes behind serve.py share generated SQL and results through one SQLite file
+        shared_path = tenant_path(os.getenv("SHARED_CACHE_PATH"), tenant) or None
+        self.shared_cache = SharedCacheStore(
+            shared_path,
+            max_bytes=int(float(os.getenv("SHARED_CACHE_MB", "256")) * 1024 * 1024),
+            ttl=float(os.getenv("SQL_CACHE_TTL", "3600"))
+        ) if shared_path else None
+        self.sql_cache = SQLCache(
+            max_entries=int(os.getenv("SQL_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("SQL_CACHE_TTL", "3600")),
+            # the shared store already persists SQL; several workers must not rewrite one JSON file
+            path=None if shared_path else tenant_path(os.getenv("SQL_CACHE_PATH"), tenant) or None,
+            shared=self.shared_cache
+        )
+        self.result_cache = ResultCache(
+            max_bytes=int(float(os.getenv("RESULT_CACHE_MB", "64")) * 1024 * 1024),
+            shared=self.shared_cache
+        )
+        # Rendered chart images for the Streamlit app and GET /chart
+        self.chart_cache = ChartCache(
+            max_bytes=int(float(os.getenv("CHART_CACHE_MB", "32")) * 1024 * 1024)
         )
+        self.rewriter = RollupRewriter()
+        self.intents = IntentMatcher() if os.getenv("INTENT_FAST_PATH", "1") != "0" else None
+        self.schema = SchemaContext(exclude=self.rewriter.rollups)
+        self.llm_usage = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'seconds': 0.0}
+        self._usage_lock = threading.Lock()
+        self.guard = ExecutionGuard(
+            max_rows=int(os.getenv("GUARD_MAX_ROWS", "10000")),
+            large_table_rows=int(os.getenv("GUARD_LARGE_TABLE_ROWS", "100000")),
+            max_seconds=float(os.getenv("GUARD_TIMEOUT_S", "10")),
+            max_steps=int(os.getenv("GUARD_MAX_STEPS", "1000000000"))
+        )
+        self.query_log = QueryLog(path=tenant_path(os.getenv("QUERY_LOG_PATH"), tenant) or None)
+        self.columnar = create_columnar_engine(
+            tenant_path(os.getenv("COLUMNAR_SNAPSHOT_DIR"), tenant) or None,
+            os.getenv("COLUMNAR_ENGINE", "auto")
+        )
+        self.slow_log = SlowQueryLog(
+            threshold_ms=float(os.getenv("SLOW_QUERY_MS", "1000")),
+            path=os.getenv("SLOW_QUERY_LOG") or None
+        )
+        # Concurrent identical questions share one LLM call, identical SQL one execution
+        self.generation = SingleFlight("llm")
+        self.execution = SingleFlight("sql")
+        # The API joins identical requests on its event loop, before they take a stage slot
+        self.generation_requests = AsyncSingleFlight("llm")
+        self.execution_requests = AsyncSingleFlight("sql")
+        self.coalesce_timeout = float(os.getenv("COALESCE_TIMEOUT_S", "30")) or None
+        self._known_version = None
+        self._schema_version = None
+        self.warm = False
+        self.warmup_seconds = None
+        self.setup_components()
+        
+    def setup_components(self):
+        if self.llm is None:
+            self.llm = create_backend()
         
-        self.sql_chain = SQLDatabaseChain.from_llm(
-            llm=self.llm,
-            db=self.db,
-            prompt=sql_prompt,
-            verbose=False,
-            return_intermediate_steps=True
+        self.pool = ReadOnlyPool(
+            self.db_path,
+            size=int(os.getenv("SQLITE_POOL_SIZE", "4")),
+            mmap_mb=float(os.getenv("SQLITE_MMAP_MB", "256")),
+            cache_mb=float(os.getenv("SQLITE_CACHE_MB", "64"))
         )
+        self._sql_prompt = None
     
-    def query_database(self, question: str):
+    @property
+    def sql_prompt(self):
+        # langchain is slow to import; build the template on first use (or in warmup)
+        if self._sql_prompt is None:
+            from langchain_core.prompts import PromptTemplate
+
+            self._sql_prompt = PromptTemplate(input_variables=["input", "table_info", "dialect"], template=SQL_PROMPT)
+        return self._sql_prompt
+    
+    def warmup(self):
+        """Load everything the first request would otherwise pay for: connections, schema, plan and
+        cache state, the LLM client and the prompt. Sets `warm` when done; safe to call again."""
+        started = time.perf_counter()
+        self.refresh_schema_fingerprint()
+        with contextlib.ExitStack() as stack:
+            conns = [stack.enter_context(self.pool.connection()) for _ in range(self.pool.size)]
+            version = self.data_version(conns[0])
+            self.schema.refresh(conns[0], version)
+            self.guard.refresh(conns[0], version)
+            self.rewriter.refresh(conns[0], version)
+        self.result_cache.check_version(version)
+        if self.columnar is not None:
+            self.columnar.snapshot_for(version)
+        self.llm.warmup()
+        for question in WARMUP_QUESTIONS:
+            self.build_prompt(question)
+        self.warmup_seconds = time.perf_counter() - started
+        self.warm = True
+        logger.info("Agent warm in %.0f ms", self.warmup_seconds * 1000)
+    
+    def memory_bytes(self):
+        """Rough resident size: cached results and charts, columnar data and open connections' page caches"""
+        total = AGENT_BASE_BYTES + self.result_cache.stats()['bytes'] + self.chart_cache.stats()['bytes']
+        if self.columnar is not None:
+            total += self.columnar.cached_bytes()
+        try:
+            db_bytes = os.path.getsize(self.db_path)
+        except OSError:
+            db_bytes = 0
+        # a connection's page cache never holds more than the database itself
+        return total + self.pool.opened() * min(self.pool.cache_kb * 1024, db_bytes)
+    
+    def close(self):
+        """Release connections and file handles; requests still holding the agent finish normally"""
+        self.sql_cache.flush()
+        self.query_log.flush()
+        self.pool.dispose()
+        if self.shared_cache is not None:
+            self.shared_cache.close()
+    
+    def refresh_schema_fingerprint(self):
+        """Invalidate the SQL cache when the tables built by the data processor change"""
+        with self.pool.connection() as conn:
+            version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            if version != self._schema_version:
+                self.sql_cache.check_schema(schema_fingerprint(conn))
+                self._schema_version = version
+    
+    def data_version(self, conn):
+        """Changes whenever the processor rebuilds the schema or reloads the tables"""
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        load_generation = conn.execute("PRAGMA user_version").fetchone()[0]
+        return (schema_version, load_generation)
+    
+    def execute_sql(self, sql_query: str):
+        with self.pool.connection() as conn:
+            version = self.data_version(conn)
+            self.result_cache.check_version(version)
+            df = self.result_cache.get(sql_query, version)
+            if df is None:
+                df = self.execution.do((sql_query, version), lambda: self.run_query(conn, sql_query, version),
+                                       self.coalesce_timeout)
+        return df
+    
+    def run_query(self, conn, sql_query, version):
+        with timed('plan'):
+            rewritten, findings = self.check_plan(conn, sql_query, version)
+        df = self.run_columnar(rewritten, findings, version)
+        self.note_executed(rewritten, 'sqlite' if df is None else self.columnar.name)
+        if df is None:
+            with timed('sql'):
+                started = time.perf_counter()
+                with self.guard.budget(conn):
+                    cursor = conn.execute(rewritten)
+                    try:
+                        columns = [d[0] for d in cursor.description]
+                        rows = cursor.fetchall()
+                    finally:
+                        cursor.close()
+                self.query_log.record(rewritten, time.perf_counter() - started, len(rows))
+            with timed('dataframe'):
+                df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        self.result_cache.set(sql_query, version, df)
+        return df
+    
+    def note_executed(self, sql_query, engine):
+        timings = current_timings()
+        if timings is not None:
+            timings.executed.append((engine, sql_query))
+    
+    def check_plan(self, conn, sql_query, version):
+        """Rewrite onto rollups, then let the guard inspect the plan; returns (sql, findings), raises QueryRejected"""
+        rewritten = self.rewriter.rewrite(sql_query, conn, version)
+        _, findings = self.guard.inspect(conn, rewritten, version)
+        if findings:
+            logger.info("Guard flagged %s: %s", rewritten, findings)
+        return rewritten, findings
+    
+    def run_columnar(self, sql_query, findings, version):
+        """Send aggregates that would fully scan a large table to the columnar engine; None means use SQLite"""
+        if self.columnar is None or not any(finding['issue'] == 'full_scan' for finding in findings):
+            return None
+        with timed('columnar'):
+            try:
+                return self.columnar.execute(sql_query, version)
+            except Exception:
+                logger.exception("Columnar engine failed on %s; running it on SQLite", sql_query)
+                return None
+    
+    def fetch_guarded(self, sql_query: str):
+        """Execute with the guard's row cap; returns (df, reason) where reason explains a truncation"""
+        limited_sql, limit = self.guard.limit(sql_query)
+        df = self.execute_sql(limited_sql)
+        if limit is None or len(df) <= limit:
+            return df, None
+        reason = {
+            'code': 'row_limit',
+            'message': f"Showing the first {limit:,} rows; aggregate or add a LIMIT to see fewer",
+            'limit': limit
+        }
+        return df.iloc[:limit], reason
+    
+    def data_files(self):
+        """Identity of the database and its WAL file; any committed write changes it"""
+        identity = []
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            try:
+                stat = os.stat(path)
+                identity.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                identity.append(None)
+        return tuple(identity)
+    
+    def current_data_version(self):
+        files = self.data_files()
+        with self.pool.connection() as conn:
+            version = self.data_version(conn)
+        self._known_version = (files, version)
+        return version
+    
+    def known_data_version(self):
+        """The last data version read, if the database files have not changed since; else None (use current_data_version)"""
+        known = self._known_version
+        if known is not None and known[0] == self.data_files():
+            return known[1]
+        return None
+    
+    def iter_rows(self, sql_query: str, chunk_size=1000):
+        """Yield (columns, rows) chunks straight from a pooled cursor without building a DataFrame"""
+        with self.pool.connection() as conn:
+            version = self.data_version(conn)
+            sql_query, findings = self.check_plan(conn, sql_query, version)
+            df = self.run_columnar(sql_query, findings, version)
+            self.note_executed(sql_query, 'sqlite' if df is None else self.columnar.name)
+            if df is not None:
+                columns, rows = list(df.columns), list(df.itertuples(index=False, name=None))
+                for start in range(0, len(rows), chunk_size):
+                    yield columns, rows[start:start + chunk_size]
+                return
+            with self.guard.budget(conn) as budget:
+                started = time.perf_counter()
+                cursor = conn.execute(sql_query)
+                elapsed, row_count = time.perf_counter() - started, 0
+                try:
+                    columns = [d[0] for d in cursor.description]
+                    while True:
+                        budget.resume()
+                        started = time.perf_counter()
+                        rows = cursor.fetchmany(chunk_size)
+                        elapsed += time.perf_counter() - started
+                        budget.pause()
+                        if not rows:
+                            break
+                        row_count += len(rows)
+                        yield columns, rows
+                finally:
+                    cursor.close()
+                    self.query_log.record(sql_query, elapsed, row_count)
+    
+    def generate_sql(self, question: str) -> str:
+        sql_query = self.lookup_sql(question)
+        if sql_query is not None:
+            return sql_query
+        return self.generation.do(normalize_question(question),
+                                  lambda: self.store_sql(question, self.call_llm(question)),
+                                  self.coalesce_timeout)
+    
+    def generate_sql_stream(self, question: str):
+        """Yield the SQL text as the LLM writes it and return the cleaned query.
+
+        Intent and cache hits yield nothing, and neither do callers that join a
+        generation of the same question already in flight.
+        """
+        sql_query = self.lookup_sql(question)
+        if sql_query is not None:
+            return sql_query
+        
+        key = normalize_question(question)
+        while True:
+            call, leader = self.generation.begin(key)
+            if leader:
+                break
+            try:
+                return self.generation.wait(call, self.coalesce_timeout)
+            except Abandoned:
+                continue
+        
         try:
-            result = self.sql_chain({"query": question})
-           
-            sql_query = ""
-            if 'intermediate_steps' in result and result['intermediate_steps']:
-             
-                if len(result['intermediate_steps']) > 0:
-                    sql_query = result['intermediate_steps'][0].get('sql_cmd', '')
+            with timed('prompt'):
+                prompt = self.build_prompt(question)
+            started = time.perf_counter()
+            stream = self.llm.stream(prompt, question, stop=["\nSQLResult:"])
+            pieces = []
+            while True:
+                try:
+                    piece = next(stream)
+                except StopIteration as done:
+                    usage = done.value or {}
+                    break
+                pieces.append(piece)
+                yield piece
+            elapsed = time.perf_counter() - started
+            record('llm', elapsed)
+            self.record_usage(question, prompt, usage.get('prompt_tokens'), usage.get('completion_tokens'), elapsed)
+            sql_query = self.store_sql(question, "".join(pieces))
+        except BaseException as e:
+            self.generation.finish(key, call, error=e)
+            raise
+        self.generation.finish(key, call, result=sql_query)
+        return sql_query
+    
+    def lookup_sql(self, question: str):
+        """SQL from the intent fast path or the SQL cache, or None if the LLM has to write it"""
+        if self.intents is not None:
+            with timed('intent'):
+                matched_sql = self.intents.match(question)
+            if matched_sql is not None:
+                return matched_sql
         
-            if not sql_query:
-                sql_query = result.get('result', '')
-            
-            sql_query = self.clean_sql_query(sql_query)
+        self.refresh_schema_fingerprint()
+        return self.sql_cache.get(question)
+    
+    def store_sql(self, question: str, sql_text: str) -> str:
+        with timed('clean_sql'):
+            sql_query = self.clean_sql_query(sql_text)
+        if sql_query and sql_query.upper().startswith('SELECT'):
+            self.sql_cache.set(question, sql_query)
+        return sql_query
+    
+    def build_prompt(self, question: str) -> str:
+        """Render the SQL prompt with the schema pruned to what the question needs"""
+        with self.pool.connection() as conn:
+            self.schema.refresh(conn, self.data_version(conn))
+        table_info, tables = self.schema.table_info(question)
+        logger.debug("Schema context for %r: %s", question, ", ".join(tables))
+        return self.sql_prompt.format(input=question, table_info=table_info, dialect="sqlite")
+    
+    def call_llm(self, question: str) -> str:
+        with timed('prompt'):
+            prompt = self.build_prompt(question)
+        started = time.perf_counter()
+        with timed('llm'):
+            response = self.llm.complete(prompt, question, stop=["\nSQLResult:"])
+        elapsed = time.perf_counter() - started
+        self.record_usage(question, prompt, response['prompt_tokens'], response['completion_tokens'], elapsed)
+        return response['text']
+    
+    def record_usage(self, question, prompt, prompt_tokens, completion_tokens, elapsed):
+        estimated = prompt_tokens is None
+        if estimated:
+            prompt_tokens = len(prompt) // 4
+        with self._usage_lock:
+            self.llm_usage['calls'] += 1
+            self.llm_usage['prompt_tokens'] += prompt_tokens
+            self.llm_usage['completion_tokens'] += completion_tokens or 0
+            self.llm_usage['seconds'] += elapsed
+        logger.info(
+            "SQL prompt (%s): %d%s tokens, %.0f ms for %r", self.llm.name, prompt_tokens,
+            " (estimated)" if estimated else "", elapsed * 1000, question
+        )
+    
+    def run_sql(self, question: str, sql_query: str):
+        if sql_query and sql_query.strip().upper().startswith('SELECT'):
+            try:
+                df, reason = self.fetch_guarded(sql_query)
+            except QueryRejected as e:
+                return {'error': str(e), 'reason': e.reason}
+            except sqlite3.Error as e:
+                return {'error': f"Query failed: {e}"}
+            finally:
+                self.log_if_slow(question, sql_query)
             
-            if sql_query and sql_query.strip().upper().startswith('SELECT'):
-                conn = sqlite3.connect(self.db_path)
-                df = pd.read_sql_query(sql_query, conn)
-                conn.close()
+            result = {
+                'question': question,
+                'sql': sql_query,
+                'results': df,
+                'row_count': len(df),
+                'truncated': reason is not None
+            }
+            if reason:
+                result['reason'] = reason
+            return result
+        else:
+            return {'error': f"Invalid SQL generated: {sql_query}"}
+    
+    def run_page(self, question: str, sql_query: str, offset=0, limit=1000):
+        """Run one page of the result set; row_count is always the size of the full result"""
+        if not (sql_query and sql_query.strip().upper().startswith('SELECT')):
+            return {'error': f"Invalid SQL generated: {sql_query}"}
+        
+        body = sql_query.strip().rstrip(';')
+        try:
+            df = self.execute_sql(f"SELECT * FROM ({body}) LIMIT {int(limit) + 1} OFFSET {int(offset)}")
+            has_more = len(df) > limit
+            if has_more:
+                df = df.iloc[:limit]
+                row_count = int(self.execute_sql(f"SELECT COUNT(*) FROM ({body})").iloc[0, 0])
+            else:
+                row_count = offset + len(df)
+        except QueryRejected as e:
+            return {'error': str(e), 'reason': e.reason}
+        except sqlite3.Error as e:
+            return {'error': f"Query failed: {e}"}
+        finally:
+            self.log_if_slow(question, sql_query)
+        
+        return {
+            'question': question,
+            'sql': sql_query,
+            'results': df,
+            'row_count': row_count,
+            'offset': offset,
+            'next_offset': offset + limit if has_more else None
+        }
+    
+    def log_if_slow(self, question: str, sql_query: str, timings=None):
+        """Write the question, SQL, stage timings and query plan to the slow-query log if any stage was slow"""
+        timings = timings or current_timings()
+        if timings is None or not self.slow_log.is_slow(timings):
+            return
+        timings.question, timings.sql = question, sql_query
+        self.slow_log.record(timings, self.explain(sql_query, timings.executed))
+    
+    def explain(self, sql_query: str, executed=None):
+        """EXPLAIN QUERY PLAN of the statements this request actually ran (pages, counts, after rollup
+        rewriting), or of the rewritten statement if it ran none itself (e.g. a cache hit)"""
+        try:
+            with self.pool.connection() as conn:
+                if not executed:
+                    executed = [('sqlite', self.rewriter.rewrite(sql_query, conn, self.data_version(conn)))]
+                plan = []
+                for engine, statement in executed:
+                    if len(executed) > 1:
+                        plan.append(f"{engine}: {statement}")
+                    if engine != 'sqlite':
+                        plan.append(f"{engine} engine over the Parquet snapshot")
+                        continue
+                    plan.extend(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}"))
+                return plan
+        except Exception as e:
+            return [f"unavailable: {e}"]
+    
+    def query_database(self, question: str):
+        with request_scope():
+            try:
+                sql_query = self.generate_sql(question)
+                return self.run_sql(question, sql_query)
+            except Exception as e:
+                return {'error': str(e)}
+    
+    def stream_answer(self, question: str, chunk_size=1000):
+        """Answer a question as a series of (event, payload) pairs for progressive display.
+
+        'sql_token' carries SQL text as the LLM writes it and 'sql' the final query;
+        then each 'rows' DataFrame chunk is followed by an 'explanation' of the rows so
+        far. 'done' carries the same result as query_database, 'error' its error dict.
+        """
+        with request_scope():
+            sql_query = None
+            try:
+                tokens = self.generate_sql_stream(question)
+                while True:
+                    try:
+                        yield 'sql_token', next(tokens)
+                    except StopIteration as done:
+                        sql_query = done.value
+                        break
+                if not (sql_query and sql_query.strip().upper().startswith('SELECT')):
+                    yield 'error', {'error': f"Invalid SQL generated: {sql_query}"}
+                    return
+                yield 'sql', sql_query
                 
-                return {
+                limited_sql, limit = self.guard.limit(sql_query)
+                version = self.current_data_version()
+                self.result_cache.check_version(version)
+                cached = self.result_cache.get(limited_sql, version)
+                if cached is None:
+                    # Rows are streamed per request, but an identical execution already running is shared
+                    _, cached = self.execution.join((limited_sql, version), self.coalesce_timeout)
+                chunks = [cached] if cached is not None else self.stream_frames(limited_sql, chunk_size)
+                stats, frames, shown = SummaryStats(), [], 0
+                for chunk in chunks:
+                    frames.append(chunk)
+                    if limit is not None:
+                        chunk = chunk.iloc[:max(limit - shown, 0)]
+                    if chunk.empty:
+                        continue
+                    shown += len(chunk)
+                    stats.update(chunk)
+                    yield 'rows', chunk
+                    with timed('explanation'):
+                        explanation = explain_summary(stats, question)
+                    yield 'explanation', explanation
+            except QueryRejected as e:
+                yield 'error', {'error': str(e), 'reason': e.reason}
+                return
+            except Exception as e:
+                yield 'error', {'error': str(e)}
+                return
+            finally:
+                self.log_if_slow(question, sql_query)
+            
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else (frames[0] if frames else pd.DataFrame())
+            if cached is None:
+                self.result_cache.set(limited_sql, version, df)
+            result = {'question': question, 'sql': sql_query, 'results': df.iloc[:shown], 'row_count': shown, 'truncated': len(df) > shown}
+            if result['truncated']:
+                result['reason'] = {
+                    'code': 'row_limit',
+                    'message': f"Showing the first {limit:,} rows; aggregate or add a LIMIT to see fewer",
+                    'limit': limit
+                }
+            result['explanation'] = explain_summary(stats, question) if shown else "No data found for your query."
+            yield 'done', result
+    
+    def stream_frames(self, sql_query: str, chunk_size=1000):
+        for columns, rows in self.iter_rows(sql_query, chunk_size):
+            with timed('dataframe'):
+                chunk = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            yield chunk
+    
+    def query_many(self, questions, max_workers=None, generate=None, execute=None):
+        """Answer a batch of questions, returning one result or error per input in order.
+
+        Identical questions are generated once and identical SQL is executed once.
+        Up to `max_workers` (BATCH_FANOUT) generations run at once and up to the
+        pool size of queries. `generate(question) -> sql` and
+        `execute(sql) -> (df, reason)` default to generate_sql and fetch_guarded;
+        the API passes its own so that the work runs on its shared stages.
+        """
+        max_workers = max_workers or int(os.getenv("BATCH_FANOUT", "8"))
+        generate = generate or self.generate_sql
+        execute = execute or self.fetch_guarded
+        unique_questions = {}
+        for question in questions:
+            unique_questions.setdefault(normalize_question(question), question)
+        
+        def generate_one(question):
+            try:
+                return generate(question), None
+            except Exception as e:
+                return None, str(e)
+        
+        def execute_one(sql_query):
+            try:
+                df, reason = execute(sql_query)
+                return (df, reason is not None), None
+            except Exception as e:
+                return None, str(e)
+        
+        generated = {}
+        if unique_questions:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_questions))) as executor:
+                generated = dict(zip(unique_questions, executor.map(generate_one, unique_questions.values())))
+        
+        valid_sql = sorted({sql for sql, error in generated.values()
+                            if sql and sql.upper().startswith('SELECT')})
+        executed = {}
+        if valid_sql:
+            with ThreadPoolExecutor(max_workers=min(self.pool.size, len(valid_sql))) as executor:
+                executed = dict(zip(valid_sql, executor.map(execute_one, valid_sql)))
+        return self.batch_answers(questions, generated, executed)
+    
+    @staticmethod
+    def batch_answers(questions, generated, executed):
+        """One result or error per input question, in order.
+
+        `generated` maps each normalized question to (sql, error) and `executed`
+        maps each distinct SELECT to ((df, truncated), error).
+        """
+        answers = []
+        for question in questions:
+            sql_query, error = generated[normalize_question(question)]
+            if error is None and sql_query not in executed:
+                error = f"Invalid SQL generated: {sql_query}"
+            if error is None:
+                fetched, error = executed[sql_query]
+            if error is not None:
+                answers.append({'question': question, 'error': error})
+            else:
+                df, truncated = fetched
+                answers.append({
                     'question': question,
                     'sql': sql_query,
                     'results': df,
-                    'row_count': len(df)
-                }
-            else:
-                return {'error': f"Invalid SQL generated: {sql_query}"}
-                
-        except Exception as e:
-            return {'error': str(e)}
+                    'row_count': len(df),
+                    'truncated': truncated
+                })
+        return answers
     
     def clean_sql_query(self, sql_text: str) -> str:
         """Clean SQL query by removing markdown formatting and extra whitespace"""
@@ -0,0 +1,339 @@
+import atexit
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# Writes to the SQL cache file are batched: one rewrite at most this often, off the request path
+SQL_CACHE_SAVE_DELAY_S = 1.0
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation so near-duplicate questions share a key"""
+    text = " ".join(question.lower().split())
+    return text.rstrip(" ?.!")
+
+
+def schema_fingerprint(conn) -> str:
+    """Hash of every table and view definition, stable across identical rebuilds (indexes don't change the SQL to write)"""
+    rows = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL AND type != 'index' ORDER BY type, name"
+    ).fetchall()
+    return hashlib.sha256(repr(rows).encode()).hexdigest()[:16]
+
+
+class SQLCache:
+    """LRU + TTL cache from normalized question text to cleaned SQL.
+
+    Entries are tied to a schema fingerprint; when the fingerprint changes the
+    whole cache is dropped. If `path` is given the cache is written through to a
+    JSON file (at most once per `save_delay` seconds, from a background timer,
+    and at exit) and reloaded on start-up. With a `shared` SharedCacheStore, misses
+    fall through to the entries other worker processes have written.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600, path=None, shared=None, save_delay=SQL_CACHE_SAVE_DELAY_S):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_delay = save_delay
+        self.shared = shared
+        self.schema = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes whole file rewrites so an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._timer = None
+        if path:
+            self.load()
+            atexit.register(_save_at_exit, weakref.ref(self))
+
+    def check_schema(self, fingerprint: str):
+        with self._lock:
+            if fingerprint == self.schema:
+                return
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.schema = fingerprint
+        self.schedule_save()
+
+    def get(self, question: str):
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                sql, stored_at = entry
+                if not self.ttl or time.time() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return sql
+                del self._entries[key]
+            schema = self.schema
+            if self.shared is None or not schema:
+                self.misses += 1
+                return None
+        entry = self.shared.get_sql(key, schema)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, *entry)
+            return entry[0]
+
+    def set(self, question: str, sql: str):
+        key = normalize_question(question)
+        with self._lock:
+            self._remember(key, sql)
+            schema = self.schema
+        if self.shared is not None and schema:
+            self.shared.set_sql(key, schema, sql)
+        self.schedule_save()
+
+    def _remember(self, key, sql, stored_at=None):
+        self._entries[key] = (sql, stored_at or time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.schedule_save()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+    def schedule_save(self):
+        """Write the file once the current batch of changes settles, on a timer thread"""
+        if not self.path:
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.save_delay, self._save_pending)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _save_pending(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.save()
+        except OSError as e:
+            print(f"⚠️  WARNING: could not write SQL cache file {self.path}: {e}")
+
+    def flush(self):
+        """Write changes still waiting for the timer now (at exit, or when the agent closes)"""
+        with self._lock:
+            timer = self._timer
+        if timer is not None:
+            timer.cancel()
+            self._save_pending()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                payload = {
+                    'schema': self.schema,
+                    'entries': [[key, sql, stored_at] for key, (sql, stored_at) in self._entries.items()],
+                }
+            # a private temp file next to the target, so the replace stays atomic and writers never collide
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                            prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(payload, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
+                raise
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            print(f"⚠️  WARNING: ignoring unreadable SQL cache file {self.path}")
+            return
+        now = time.time()
+        with self._lock:
+            self.schema = payload.get('schema')
+            for key, sql, stored_at in payload.get('entries', [])[-self.max_entries:]:
+                if not self.ttl or now - stored_at <= self.ttl:
+                    self._entries[key] = (sql, stored_at)
+
+
+def _save_at_exit(ref):
+    cache = ref()
+    if cache is not None:
+        cache.flush()
+
+
+def frame_size(df) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCache:
+    """LRU cache of query results keyed by SQL text and data version, bounded by memory.
+
+    Cached DataFrames are shared between callers and must be treated as read-only.
+    With a `shared` SharedCacheStore, results are also written there for other
+    worker processes, and misses are looked up there before running the query.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, shared=None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.version = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_version(self, version):
+        with self._lock:
+            if version == self.version:
+                return
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.size = 0
+            self.version = version
+        if self.shared is not None:
+            self.shared.check_version(version)
+
+    def get(self, sql: str, version):
+        with self._lock:
+            entry = self._entries.get((sql, version))
+            if entry is not None:
+                self._entries.move_to_end((sql, version))
+                self.hits += 1
+                return entry[0]
+            if self.shared is None:
+                self.misses += 1
+                return None
+        df = self.shared.get_result(sql, version)
+        with self._lock:
+            if df is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store(sql, version, df)
+        return df
+
+    def set(self, sql: str, version, df):
+        self._store(sql, version, df)
+        if self.shared is not None:
+            self.shared.set_result(sql, version, df)
+
+    def _store(self, sql, version, df):
+        size = frame_size(df)
+        if size > self.max_bytes:
+            return
+        key = (sql, version)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (df, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+
+class ChartCache:
+    """LRU cache of rendered chart images (PNG/SVG bytes), bounded by memory.
+
+    Keys come from utils.visualization.chart_key: a content hash of the plotted
+    rows plus chart type and format, so identical results share one image.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def set(self, key, image: bytes):
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = image
+            self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,395 @@
+"""Columnar execution for scan-heavy aggregates, over Parquet snapshots written by the data processor.
+
+Two engines share one interface, `execute(sql, version)`, which returns a DataFrame
+or None when the query is outside what the engine handles or the snapshot is
+older than the database (the caller then runs it on SQLite):
+
+- DuckDBEngine, when the optional duckdb package is installed;
+- VectorEngine, vectorized pandas/NumPy evaluation over cached columns.
+
+Both only take single-table aggregate statements (SUM/AVG/COUNT/MIN/MAX, an
+optional single GROUP BY column, AND-ed comparisons in WHERE, ORDER BY output
+columns, LIMIT/OFFSET), plus the pagination and COUNT(*) wrappers the agent puts
+around them, so SQLite and columnar results agree. Float sums may differ in the
+last digits because the summation order differs, and DECIMAL columns are read as
+floats where SQLite keeps whole values as integers.
+"""
+import json
+import os
+import re
+import threading
+
+import pandas as pd
+
+from core.rewrite import ALIAS, STATEMENT, UNSUPPORTED, split_top_level, unwrap
+from data.processor import EcommerceDataProcessor
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pq = None
+
+LIMIT_OFFSET = re.compile(r"^(?P<body>.+?)\s+LIMIT\s+(?P<limit>\d+)\s+OFFSET\s+(?P<offset>\d+)\s*;?$", re.IGNORECASE | re.DOTALL)
+AGGREGATE = re.compile(r"^(?P<func>SUM|AVG|COUNT|MIN|MAX)\s*\(\s*(?P<column>\*|\w+)\s*\)$", re.IGNORECASE)
+LITERAL = r"(?:'(?:[^']|'')*'|-?\d+(?:\.\d+)?)"
+CONDITION = re.compile(
+    r"\s*(?P<column>\w+)\s*(?:"
+    r"(?P<op><=|>=|<>|!=|==|=|<|>)\s*(?P<value>" + LITERAL + r")"
+    r"|BETWEEN\s+(?P<low>" + LITERAL + r")\s+AND\s+(?P<high>" + LITERAL + r")"
+    r"|IN\s*\((?P<values>\s*" + LITERAL + r"(?:\s*,\s*" + LITERAL + r")*\s*)\)"
+    r"|IS\s+(?P<negated>NOT\s+)?NULL"
+    r")\s*(?:AND\b|$)",
+    re.IGNORECASE
+)
+ORDER_ITEM = re.compile(r"^(?P<name>\"[^\"]+\"|[\w()*]+(?:\s*\(\s*[\w*]+\s*\))?)(?:\s+(?P<direction>ASC|DESC))?$", re.IGNORECASE)
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+def parse_literal(text):
+    if text.startswith("'"):
+        return text[1:-1].replace("''", "'")
+    return float(text) if '.' in text else int(text)
+
+
+def read_pointer(snapshot_dir):
+    """The current snapshot's data version and directory, or None if nothing was exported"""
+    pointer = os.path.join(snapshot_dir, EcommerceDataProcessor.SNAPSHOT_POINTER)
+    try:
+        with open(pointer, encoding="utf-8") as f:
+            current = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return tuple(current['version']), os.path.join(snapshot_dir, current['path'])
+
+
+def parse_statement(sql_query):
+    """Break a supported aggregate statement into parts, raising UnsupportedQuery otherwise"""
+    sql_query = sql_query.strip().rstrip(';')
+    if UNSUPPORTED.search(sql_query):
+        raise UnsupportedQuery("joins, subqueries and qualified columns run on SQLite")
+    offset = 0
+    match = LIMIT_OFFSET.match(sql_query)
+    if match:
+        sql_query, offset = f"{match.group('body')} LIMIT {match.group('limit')}", int(match.group('offset'))
+    match = STATEMENT.match(sql_query)
+    if not match or match.group('having'):
+        raise UnsupportedQuery("not a single-table aggregate")
+    group = match.group('group')
+
+    outputs = []
+    for item in split_top_level(match.group('select')):
+        parts = ALIAS.match(item)
+        expr, alias = parts.group('expr').strip(), parts.group('alias')
+        name = alias.strip('"') if alias else expr
+        aggregate = AGGREGATE.match(expr)
+        if aggregate:
+            outputs.append((name, aggregate.group('func').upper(), aggregate.group('column')))
+        elif group and expr.lower() == group.lower():
+            outputs.append((name, None, group))
+        else:
+            raise UnsupportedQuery(f"unsupported select item: {item}")
+    if not any(func for _, func, _ in outputs):
+        raise UnsupportedQuery("no aggregate")
+
+    conditions = []
+    where = match.group('where') or ''
+    position = 0
+    while position < len(where):
+        condition = CONDITION.match(where, position)
+        if not condition or condition.end() == position:
+            raise UnsupportedQuery(f"unsupported condition: {where[position:]}")
+        position = condition.end()
+        conditions.append(condition)
+
+    order = []
+    if match.group('order'):
+        for item in split_top_level(match.group('order')):
+            parsed = ORDER_ITEM.match(item.strip())
+            if not parsed:
+                raise UnsupportedQuery(f"unsupported order: {item}")
+            order.append((parsed.group('name').strip('"'), (parsed.group('direction') or 'ASC').upper() == 'ASC'))
+
+    limit = int(match.group('limit')) if match.group('limit') else None
+    return {
+        'table': match.group('table').lower(),
+        'outputs': outputs,
+        'group': group,
+        'conditions': conditions,
+        'order': order,
+        'limit': limit,
+        'offset': offset,
+    }
+
+
+def to_frame(columns, rows):
+    # Same construction as the SQLite path so dtypes match
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+class SnapshotEngine:
+    """Tracks which Parquet snapshot matches the database's data version"""
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        self.queries = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._version = None
+        self._path = None
+
+    def snapshot_for(self, version):
+        """Directory of the snapshot taken at `version`, or None if the latest export is older"""
+        with self._lock:
+            # until a matching export lands, look for it again on every call
+            if self._version != version or self._path is None:
+                current = read_pointer(self.snapshot_dir)
+                self._version, self._path = version, None
+                if current is not None and current[0] == tuple(version):
+                    self._path = current[1]
+                    self.reset()
+            return self._path
+
+    def reset(self):
+        pass
+
+    def cached_bytes(self):
+        """Memory held by columns read from the snapshot"""
+        return 0
+
+    def execute(self, sql_query, version):
+        path = self.snapshot_for(version)
+        if path is None:
+            return self._fallback()
+        inner, page_limit, page_offset, count_only = unwrap(sql_query)
+        try:
+            parsed = parse_statement(inner)
+            parsed['count_only'] = count_only
+            if page_limit is not None:
+                # fold the page into the statement's own LIMIT/OFFSET window
+                start = parsed['offset'] + page_offset
+                end = start + page_limit
+                if parsed['limit'] is not None:
+                    end = min(end, parsed['offset'] + parsed['limit'])
+                parsed['offset'], parsed['limit'] = start, max(end - start, 0)
+            df = self.run(path, sql_query, parsed)
+        except UnsupportedQuery:
+            return self._fallback()
+        with self._lock:
+            self.queries += 1
+        return df
+
+    def _fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {'engine': self.name, 'snapshot': self._path, 'queries': self.queries, 'fallbacks': self.fallbacks}
+
+
+class VectorEngine(SnapshotEngine):
+    """Evaluates supported aggregates with pandas over columns read once per snapshot"""
+
+    name = "vector"
+
+    def __init__(self, snapshot_dir):
+        super().__init__(snapshot_dir)
+        self._columns = {}
+        self._column_lock = threading.Lock()
+
+    def reset(self):
+        with self._column_lock:
+            self._columns = {}
+
+    def cached_bytes(self):
+        with self._column_lock:
+            return sum(int(series.memory_usage(index=False)) for series in self._columns.values())
+
+    def column(self, path, table, name):
+        key = (path, table, name)
+        with self._column_lock:
+            if key in self._columns:
+                return self._columns[key]
+        try:
+            array = pq.read_table(os.path.join(path, f"{table}.parquet"), columns=[name]).column(0)
+        except (OSError, KeyError, pa.ArrowInvalid) as e:
+            raise UnsupportedQuery(str(e))
+        # ints stay integers (nullable only when needed) so SUM/MIN/MAX come back as ints, like SQLite;
+        # text is Arrow-backed so comparisons run vectorized
+        if pa.types.is_integer(array.type):
+            series = pd.Series(array.to_pylist(), dtype="Int64") if array.null_count else pd.Series(array.to_numpy())
+        elif pa.types.is_floating(array.type):
+            series = pd.Series(array.to_numpy(zero_copy_only=False), dtype="float64")
+        else:
+            series = pd.Series(array.to_pandas(), dtype="string[pyarrow]")
+        with self._column_lock:
+            self._columns[key] = series
+        return series
+
+    def run(self, path, sql_query, parsed):
+        table = parsed['table']
+        group = parsed['group']
+        needed = {column for _, _, column in parsed['outputs'] if column != '*'}
+        needed |= {condition.group('column') for condition in parsed['conditions']}
+        if group:
+            needed.add(group)
+        columns = {name: self.column(path, table, name) for name in sorted(needed)}
+        if parsed['conditions']:
+            mask = None
+            for condition in parsed['conditions']:
+                matched = self.evaluate(columns[condition.group('column')], condition)
+                mask = matched if mask is None else mask & matched
+            columns = {name: series[mask] for name, series in columns.items()}
+            rows = int(mask.sum())
+        else:
+            rows = pq.ParquetFile(os.path.join(path, f"{table}.parquet")).metadata.num_rows
+        frame = pd.DataFrame(columns) if columns else pd.DataFrame(index=range(rows))
+
+        names = [name for name, _, _ in parsed['outputs']]
+        if len(set(names)) != len(names):
+            raise UnsupportedQuery("duplicate output names")
+        if group:
+            if frame[group].isna().any():
+                raise UnsupportedQuery("NULL group keys")
+            groups = frame.groupby(group, sort=True)
+            aggregated = {name: self.aggregate(groups, func, column) for name, func, column in parsed['outputs'] if func}
+            keys = next(iter(aggregated.values())).index
+            result = pd.DataFrame({
+                name: aggregated[name] if func else pd.Series(keys, index=keys)
+                for name, func, _ in parsed['outputs']
+            }).reset_index(drop=True)
+        else:
+            result = pd.DataFrame([[self.aggregate(frame, func, column) for _, func, column in parsed['outputs']]],
+                                  columns=names)
+        # order and cut before converting, so only the rows returned go through Python
+        result = self.order_and_limit(result, parsed)
+        if parsed['count_only']:
+            return to_frame(["COUNT(*)"], [(len(result),)])
+        return to_frame(names, [tuple(self.python_value(value) for value in row)
+                                for row in result.itertuples(index=False, name=None)])
+
+    @staticmethod
+    def evaluate(series, condition):
+        """Rows matching one WHERE condition, as a NumPy boolean mask (NULL never matches a comparison)"""
+        if condition.group('values'):
+            values = [parse_literal(v.strip()) for v in split_top_level(condition.group('values'))]
+        elif condition.group('low'):
+            values = [parse_literal(condition.group('low')), parse_literal(condition.group('high'))]
+        elif condition.group('value'):
+            values = [parse_literal(condition.group('value'))]
+        else:
+            return (series.notna() if condition.group('negated') else series.isna()).to_numpy(dtype=bool)
+        # SQLite would apply type affinity to mismatched literals; leave those to SQLite
+        text = pd.api.types.is_string_dtype(series.dtype)
+        if any(isinstance(value, str) != text for value in values):
+            raise UnsupportedQuery("literal type does not match column")
+
+        if condition.group('values'):
+            result = series.isin(values)
+        elif condition.group('low'):
+            result = (series >= values[0]) & (series <= values[1])
+        else:
+            result = {
+                '=': series.eq, '==': series.eq, '!=': series.ne, '<>': series.ne,
+                '<': series.lt, '<=': series.le, '>': series.gt, '>=': series.ge,
+            }[condition.group('op')](values[0])
+        return result.fillna(False).to_numpy(dtype=bool) & series.notna().to_numpy(dtype=bool)
+
+    @staticmethod
+    def aggregate(data, func, column):
+        grouped = isinstance(data, pd.core.groupby.DataFrameGroupBy)
+        if column == '*':
+            if func != 'COUNT':
+                raise UnsupportedQuery(f"{func}(*)")
+            return data.size() if grouped else len(data)
+        values = data[column]
+        dtype = values.obj.dtype if grouped else values.dtype
+        if func in ('SUM', 'AVG') and not pd.api.types.is_numeric_dtype(dtype):
+            raise UnsupportedQuery(f"{func} over text")
+        if func == 'COUNT':
+            return values.count()
+        if func == 'SUM':
+            return values.sum(min_count=1)
+        if func == 'AVG':
+            return values.mean()
+        return values.min() if func == 'MIN' else values.max()
+
+    @staticmethod
+    def python_value(value):
+        if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+            return None
+        return value.item() if hasattr(value, 'item') else value
+
+    @staticmethod
+    def order_and_limit(df, parsed):
+        if parsed['order']:
+            columns = {column.lower(): column for column in df.columns}
+            by, ascending = [], []
+            for name, is_ascending in parsed['order']:
+                column = columns.get(name.lower())
+                if column is None:
+                    raise UnsupportedQuery(f"order by {name}")
+                by.append(column)
+                ascending.append(is_ascending)
+            # SQLite sorts NULLs first ascending and last descending
+            df = df.sort_values(by, ascending=ascending, kind='mergesort',
+                                na_position='first' if ascending[0] else 'last')
+        if parsed['limit'] is not None:
+            df = df.iloc[parsed['offset']:parsed['offset'] + parsed['limit']]
+        return df.reset_index(drop=True)
+
+
+class DuckDBEngine(SnapshotEngine):
+    """Runs supported aggregates on DuckDB views over the Parquet snapshot"""
+
+    name = "duckdb"
+
+    def __init__(self, snapshot_dir):
+        super().__init__(snapshot_dir)
+        self.conn = duckdb.connect(database=":memory:")
+        self._views_for = None
+        self._duck_lock = threading.Lock()
+
+    def run(self, path, sql_query, parsed):
+        # DuckDB runs the statement as written, pagination wrappers included
+        with self._duck_lock:
+            if self._views_for != path:
+                for table in EcommerceDataProcessor.TABLE_DEFINITIONS:
+                    parquet = os.path.join(path, f"{table}.parquet").replace("'", "''")
+                    self.conn.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet('{parquet}')")
+                self._views_for = path
+            cursor = self.conn.cursor()
+        try:
+            result = cursor.execute(sql_query)
+            rows = [tuple(int(v) if isinstance(v, int) else v for v in row) for row in result.fetchall()]
+        except duckdb.Error as e:
+            raise UnsupportedQuery(str(e))
+        finally:
+            cursor.close()
+        # DuckDB lower-cases unaliased expression names; keep SQLite's
+        names = ["COUNT(*)"] if parsed['count_only'] else [name for name, _, _ in parsed['outputs']]
+        return to_frame(names, rows)
+
+
+def create_columnar_engine(snapshot_dir, name="auto"):
+    """The engine for COLUMNAR_ENGINE (auto, duckdb or vector), or None without a snapshot directory"""
+    if not snapshot_dir:
+        return None
+    if name in ("auto", "duckdb") and duckdb is not None:
+        return DuckDBEngine(snapshot_dir)
+    if name == "duckdb":
+        print("⚠️  WARNING: COLUMNAR_ENGINE=duckdb but duckdb is not installed; using the vector engine")
+    if pq is None:
+        print("⚠️  WARNING: pyarrow is not installed; columnar execution is disabled")
+        return None
+    return VectorEngine(snapshot_dir)
@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from core.singleflight import CancelToken, cancel_token
+
+
+class StageSaturated(Exception):
+    """Raised when a stage already has its maximum number of queued requests"""
+
+
+class StageLimiter:
+    """Runs blocking work for one pipeline stage on its own thread pool.
+
+    At most `concurrency` calls run at once; up to `max_queue` more may wait for
+    a slot, after which new calls fail fast with StageSaturated.
+    """
+
+    def __init__(self, name, concurrency=4, max_queue=32):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.running = 0
+
+    async def acquire(self):
+        """Take a slot (waiting in the queue if needed); pair with release()"""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise StageSaturated(f"{self.name} stage is saturated ({self.waiting} requests queued)")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    async def call(self, func, *args, **kwargs):
+        """Run on this stage's threads, for a caller that already holds a slot"""
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so per-request state (e.g. timings) follows the call
+        context = contextvars.copy_context()
+        token = CancelToken()
+        context.run(cancel_token.set, token)
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(context.run, func, *args, **kwargs))
+        except asyncio.CancelledError:
+            # Free the worker thread if it is only waiting on another request's shared call
+            token.cancel()
+            raise
+
+    async def run(self, func, *args, **kwargs):
+        await self.acquire()
+        try:
+            return await self.call(func, *args, **kwargs)
+        finally:
+            self.release()
+
+    def stats(self):
+        return {'concurrency': self.concurrency, 'running': self.running, 'waiting': self.waiting}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,184 @@
+import re
+import sqlite3
+import threading
+import time
+
+SCAN = re.compile(r"^(?P<kind>SCAN|SEARCH) (?:TABLE )?(?P<table>\w+)")
+AGGREGATE_CALL = re.compile(r"\b(?:SUM|AVG|COUNT|MIN|MAX|TOTAL|GROUP_CONCAT)\s*\(", re.IGNORECASE)
+GROUP_BY = re.compile(r"\bGROUP\s+BY\b", re.IGNORECASE)
+LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+# VM instructions between progress handler calls
+CHECK_INTERVAL = 10_000
+
+
+def top_level(sql_query):
+    """The statement with string literals blanked and everything inside parentheses removed"""
+    text = re.sub(r"'(?:[^']|'')*'", "''", sql_query)
+    kept, depth = [], 0
+    for char in text:
+        if char == '(':
+            if depth == 0:
+                kept.append(char)
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                kept.append(char)
+        elif depth == 0:
+            kept.append(char)
+    return "".join(kept)
+
+
+class QueryRejected(Exception):
+    """Raised when the guard refuses or aborts a query; `reason` is a JSON-friendly explanation"""
+
+    def __init__(self, code, message, **details):
+        super().__init__(message)
+        self.reason = {'code': code, 'message': message, **details}
+
+
+class Budget:
+    """Aborts the running statement once it exceeds a wall-clock or VM-step budget.
+
+    The clock only runs while resumed, so time a streaming client spends
+    between fetches is not charged to the query.
+    """
+
+    def __init__(self, conn, max_seconds, max_steps, on_abort=None):
+        self.conn = conn
+        self.on_abort = on_abort
+        self.remaining = max_seconds
+        self.max_steps = max_steps
+        self.steps = 0
+        self.exceeded = None
+        self.deadline = None
+
+    def _tick(self):
+        self.steps += CHECK_INTERVAL
+        if self.max_steps and self.steps > self.max_steps:
+            self.exceeded = 'step_budget'
+            return 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            self.exceeded = 'timeout'
+            return 1
+        return 0
+
+    def resume(self):
+        self.deadline = time.perf_counter() + self.remaining if self.remaining else None
+
+    def pause(self):
+        if self.deadline is not None:
+            self.remaining = max(self.deadline - time.perf_counter(), 0.0)
+
+    def __enter__(self):
+        self.conn.set_progress_handler(self._tick, CHECK_INTERVAL)
+        self.resume()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.set_progress_handler(None, 0)
+        if self.exceeded and exc_type is not None and issubclass(exc_type, sqlite3.OperationalError):
+            if self.on_abort is not None:
+                self.on_abort()
+            if self.exceeded == 'timeout':
+                message = "Query stopped after exceeding its time budget"
+            else:
+                message = f"Query stopped after exceeding {self.max_steps:,} SQLite VM steps"
+            raise QueryRejected(self.exceeded, message, steps=self.steps) from exc
+        return False
+
+
+class ExecutionGuard:
+    """Checks generated SQL before and while it runs.
+
+    - flags full scans and temp B-trees on tables with at least `large_table_rows` rows,
+      and rejects plans that scan two large tables in the same loop (cross joins);
+    - caps result sets that are not a single aggregate row at `max_rows`;
+    - stops statements that exceed `max_seconds` or `max_steps` VM instructions.
+    """
+
+    def __init__(self, max_rows=10000, large_table_rows=100_000, max_seconds=10.0, max_steps=0):
+        self.max_rows = max_rows
+        self.large_table_rows = large_table_rows
+        self.max_seconds = max_seconds
+        self.max_steps = max_steps
+        self.version = None
+        self.table_rows = {}
+        self.counts = {'rejected': 0, 'aborted': 0, 'limited': 0, 'flagged': 0}
+        self._lock = threading.Lock()
+
+    def refresh(self, conn, version):
+        if version == self.version:
+            return
+        # Exact counts, once per data version: MAX(rowid) overstates tables keyed by item_id
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        table_rows = {name: conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in names}
+        with self._lock:
+            self.table_rows = table_rows
+            self.version = version
+
+    def limit(self, sql_query):
+        """Return (sql, limit): the statement with a LIMIT of limit + 1 rows appended, or (sql, None) if it needs none"""
+        if not self.max_rows:
+            return sql_query, None
+        outer = top_level(sql_query)
+        if LIMIT.search(outer):
+            return sql_query, None
+        if AGGREGATE_CALL.search(outer) and not GROUP_BY.search(outer):
+            return sql_query, None
+        with self._lock:
+            self.counts['limited'] += 1
+        return f"{sql_query.strip().rstrip(';')} LIMIT {self.max_rows + 1}", self.max_rows
+
+    def inspect(self, conn, sql_query, version):
+        """Return the query plan and findings about large tables; raise QueryRejected for cross joins"""
+        self.refresh(conn, version)
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql_query}").fetchall()
+        findings = []
+        large_tables = []
+        scans_by_parent = {}
+        for node, parent, _, detail in plan:
+            match = SCAN.match(detail)
+            if not match:
+                continue
+            table = match.group('table')
+            rows = self.table_rows.get(table, 0)
+            if rows < self.large_table_rows:
+                continue
+            large_tables.append(table)
+            if match.group('kind') == 'SCAN':
+                findings.append({'issue': 'full_scan', 'table': table, 'rows': rows, 'detail': detail})
+                scans_by_parent.setdefault(parent, []).append(table)
+        if large_tables:
+            for node, parent, _, detail in plan:
+                if 'TEMP B-TREE' in detail:
+                    findings.append({'issue': 'temp_btree', 'tables': sorted(set(large_tables)), 'detail': detail})
+        if findings:
+            with self._lock:
+                self.counts['flagged'] += 1
+
+        details = [row[3] for row in plan]
+        for tables in scans_by_parent.values():
+            if len(tables) > 1:
+                with self._lock:
+                    self.counts['rejected'] += 1
+                raise QueryRejected(
+                    'cross_join',
+                    f"Query would scan {' and '.join(tables)} in a nested loop; add a join condition on an indexed column",
+                    plan=details,
+                    findings=findings
+                )
+        return details, findings
+
+    def budget(self, conn):
+        return Budget(conn, self.max_seconds, self.max_steps, on_abort=self._aborted)
+
+    def _aborted(self):
+        with self._lock:
+            self.counts['aborted'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
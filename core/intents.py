@@ -0,0 +1,211 @@
+import re
+import threading
+
+from core.cache import normalize_question
+
+# phrase -> lifetime column on products
+PRODUCT_METRICS = {
+    'total sales': 'total_lifetime_sales',
+    'lifetime sales': 'total_lifetime_sales',
+    'total lifetime sales': 'total_lifetime_sales',
+    'sales': 'total_lifetime_sales',
+    'revenue': 'total_lifetime_sales',
+    'total revenue': 'total_lifetime_sales',
+    'ad sales': 'total_lifetime_ad_sales',
+    'lifetime ad sales': 'total_lifetime_ad_sales',
+}
+
+# phrase -> (daily_ad_performance column, aggregate used per item)
+AD_METRICS = {
+    'roas': ('roas', 'AVG'),
+    'return on ad spend': ('roas', 'AVG'),
+    'cpc': ('cpc', 'AVG'),
+    'cost per click': ('cpc', 'AVG'),
+    'ctr': ('ctr', 'AVG'),
+    'click-through rate': ('ctr', 'AVG'),
+    'click through rate': ('ctr', 'AVG'),
+    'clicks': ('clicks', 'SUM'),
+    'impressions': ('impressions', 'SUM'),
+    'ad spend': ('ad_spend', 'SUM'),
+    'units sold': ('units_sold', 'SUM'),
+}
+
+# Ratio metrics are ranked over days with activity, like the best_roas_performance and cpc_analysis views
+RATIO_COLUMNS = {'roas', 'cpc', 'ctr'}
+
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'fifteen': 15, 'twenty': 20, 'fifty': 50, 'hundred': 100,
+}
+
+PREFIX = (
+    r"(?:(?:what(?: is| are|'s)|show(?: me)?|list|give me|get|calculate|find|tell me|which|how much is)\s+)*"
+    r"(?:(?:the|my|all|our)\s+)*"
+)
+METRIC = "|".join(sorted(
+    (re.escape(m) for m in set(PRODUCT_METRICS) | set(AD_METRICS)), key=len, reverse=True
+))
+COUNT = r"(?P<count>\d+|" + "|".join(NUMBER_WORDS) + ")"
+HIGH = r"(?:top|best(?: performing)?|highest|most|largest|biggest)"
+LOW = r"(?:bottom|worst(?: performing)?|lowest|least|smallest)"
+SUBJECT = r"(?:products?|items?|ads?|campaigns?)"
+
+
+def parse_count(text, default=10):
+    if not text:
+        return default
+    return int(text) if text.isdigit() else NUMBER_WORDS[text]
+
+
+def parse_amount(number, suffix):
+    amount = float(number.replace(',', ''))
+    multiplier = {'k': 1_000, 'thousand': 1_000, 'm': 1_000_000, 'million': 1_000_000}.get(suffix or '', 1)
+    return amount * multiplier
+
+
+def ranking_sql(metric, descending, limit):
+    direction = "DESC" if descending else "ASC"
+    if metric in PRODUCT_METRICS:
+        column = PRODUCT_METRICS[metric]
+        return f"SELECT item_id, {column} FROM products ORDER BY {column} {direction} LIMIT {limit}"
+    column, aggregate = AD_METRICS[metric]
+    alias = f"{'avg' if aggregate == 'AVG' else 'total'}_{column}"
+    where = f" WHERE {column} > 0" if column in RATIO_COLUMNS else ""
+    return (
+        f"SELECT item_id, {aggregate}({column}) AS {alias} FROM daily_ad_performance{where} "
+        f"GROUP BY item_id ORDER BY {alias} {direction} LIMIT {limit}"
+    )
+
+
+def top_n(match):
+    descending = not match.group('direction').startswith(('bottom', 'worst'))
+    return ranking_sql(match.group('metric'), descending, parse_count(match.group('count')))
+
+
+def extreme(match):
+    descending = re.fullmatch(LOW, match.group('direction')) is None
+    return ranking_sql(match.group('metric'), descending, 10)
+
+
+def worst_products(match):
+    return ranking_sql('total sales', False, parse_count(match.group('count')))
+
+
+def total(match):
+    metric = match.group('metric')
+    if metric in ('sales', 'revenue', 'total sales', 'total revenue'):
+        return "SELECT SUM(total_sales) AS total_sales FROM daily_sales"
+    if metric == 'ad sales':
+        return "SELECT SUM(ad_sales) AS total_ad_sales FROM daily_ad_performance"
+    if metric in AD_METRICS and AD_METRICS[metric][1] == 'SUM':
+        column = AD_METRICS[metric][0]
+        return f"SELECT SUM({column}) AS total_{column} FROM daily_ad_performance"
+    return None
+
+
+def average(match):
+    metric = match.group('metric')
+    if metric in AD_METRICS:
+        column = AD_METRICS[metric][0]
+        if match.group('per'):
+            return (
+                f"SELECT item_id, AVG({column}) AS average_{column} FROM daily_ad_performance "
+                f"GROUP BY item_id ORDER BY item_id"
+            )
+        return f"SELECT AVG({column}) AS average_{column} FROM daily_ad_performance"
+    if metric in PRODUCT_METRICS:
+        # products holds one lifetime row per item, so this already is the average per product
+        column = PRODUCT_METRICS[metric]
+        return f"SELECT AVG({column}) AS average_{column} FROM products"
+    return None
+
+
+def threshold(match):
+    metric = match.group('metric') or 'sales'
+    if metric not in PRODUCT_METRICS:
+        return None
+    column = PRODUCT_METRICS[metric]
+    above = match.group('op') in ('over', 'above', 'greater than', 'more than', 'exceeding', 'at least')
+    op = ">=" if match.group('op') == 'at least' else ">" if above else "<"
+    amount = parse_amount(match.group('amount'), match.group('suffix'))
+    return (
+        f"SELECT item_id, {column} FROM products WHERE {column} {op} {amount:g} "
+        f"ORDER BY {column} {'DESC' if above else 'ASC'}"
+    )
+
+
+def eligibility(match):
+    eligible = 0 if match.group('negation') else 1
+    return (
+        "SELECT item_id, eligibility_datetime_utc, message FROM product_eligibility "
+        f"WHERE is_eligible = {eligible} ORDER BY item_id"
+    )
+
+
+DIRECTION = r"(?P<direction>top|bottom|best(?: performing)?|worst(?: performing)?)"
+
+INTENTS = [
+    ('top_n', re.compile(
+        PREFIX + DIRECTION + r"(?: " + COUNT + r")?(?: " + SUBJECT + r")? by (?P<metric>" + METRIC + ")"
+    ), top_n),
+    ('top_n', re.compile(
+        PREFIX + COUNT + r" " + DIRECTION + r" " + SUBJECT + r" by (?P<metric>" + METRIC + ")"
+    ), top_n),
+    ('extreme', re.compile(
+        PREFIX + SUBJECT + r" (?:have|has|with) (?:the )?(?P<direction>" + HIGH + "|" + LOW + r") (?P<metric>" + METRIC + ")"
+    ), extreme),
+    ('worst_products', re.compile(
+        PREFIX + r"(?:" + COUNT + r" )?worst performing products"
+    ), worst_products),
+    ('total', re.compile(
+        PREFIX + r"total (?P<metric>" + METRIC + ")"
+    ), total),
+    ('average', re.compile(
+        PREFIX + r"(?:average|avg|mean) (?P<metric>" + METRIC + r")(?P<per> (?:per|for each|by) (?:product|item))?"
+    ), average),
+    ('threshold', re.compile(
+        PREFIX + SUBJECT + r" (?:have |has |with )?(?:(?P<metric>" + METRIC + r") )?"
+        r"(?P<op>over|above|greater than|more than|exceeding|at least|under|below|less than) "
+        r"\$?(?P<amount>[\d,]+(?:\.\d+)?)\s*(?P<suffix>k|thousand|m|million)?(?: (?:in )?(?:sales|revenue))?"
+    ), threshold),
+    ('eligibility', re.compile(
+        PREFIX + SUBJECT + r" (?:are |is )?(?P<negation>not |in)?eligible(?: for (?:advertising|ads))?"
+    ), eligibility),
+]
+
+
+class IntentMatcher:
+    """Answers common, parameterized questions with vetted SQL before falling back to the LLM"""
+
+    def __init__(self, intents=None):
+        self.intents = intents or INTENTS
+        self.hits = 0
+        self.misses = 0
+        self.by_intent = {}
+        self._lock = threading.Lock()
+
+    def match(self, question: str):
+        text = normalize_question(question).replace('’', "'")
+        for name, pattern, build in self.intents:
+            found = pattern.fullmatch(text)
+            if not found:
+                continue
+            sql_query = build(found)
+            if sql_query:
+                with self._lock:
+                    self.hits += 1
+                    self.by_intent[name] = self.by_intent.get(name, 0) + 1
+                return sql_query
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'by_intent': dict(self.by_intent),
+            }
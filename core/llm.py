@@ -0,0 +1,160 @@
+import os
+import random
+import re
+import threading
+import time
+
+from core.intents import IntentMatcher
+
+
+class LLMBackendError(Exception):
+    pass
+
+
+class GroqBackend:
+    """Generates SQL with a Groq-hosted chat model"""
+
+    name = "groq"
+
+    def __init__(self, model="llama-3.1-8b-instant", api_key=None, max_tokens=150):
+        if not api_key:
+            print("⚠️  WARNING: GROQ_API_KEY not found in .env file")
+            print("   Create a .env file with: GROQ_API_KEY=your_key_here")
+        self.model = model
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # langchain_groq is slow to import; load it with the first call (or warmup) instead of at start-up
+        with self._lock:
+            if self._client is None:
+                from langchain_groq import ChatGroq
+
+                self._client = ChatGroq(
+                    model_name=self.model,
+                    temperature=0,
+                    max_tokens=self.max_tokens,
+                    groq_api_key=self.api_key
+                )
+            return self._client
+
+    def warmup(self):
+        self.client
+
+    def complete(self, prompt, question, stop=None):
+        response = self.client.invoke(prompt, stop=stop)
+        usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage') or {}
+        return {
+            'text': response.content,
+            'prompt_tokens': usage.get('prompt_tokens'),
+            'completion_tokens': usage.get('completion_tokens'),
+        }
+
+    def stream(self, prompt, question, stop=None):
+        """Yield the SQL text as the model writes it; returns the token usage when reported"""
+        usage = {}
+        for chunk in self.client.stream(prompt, stop=stop):
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            if chunk.content:
+                yield chunk.content
+        return {'prompt_tokens': usage.get('input_tokens'), 'completion_tokens': usage.get('output_tokens')}
+
+
+# keyword in the question -> canned SQL used when no intent matches
+STUB_RULES = [
+    ('eligib', "SELECT item_id, eligibility_datetime_utc, message FROM product_eligibility "
+               "WHERE is_eligible = 1 ORDER BY item_id"),
+    ('roas', "SELECT item_id, AVG(roas) AS avg_roas FROM daily_ad_performance WHERE roas > 0 "
+             "GROUP BY item_id ORDER BY avg_roas DESC LIMIT 10"),
+    ('cpc', "SELECT item_id, AVG(cpc) AS avg_cpc FROM daily_ad_performance WHERE cpc > 0 "
+            "GROUP BY item_id ORDER BY avg_cpc DESC LIMIT 10"),
+    ('ad ', "SELECT item_id, SUM(ad_sales) AS total_ad_sales, SUM(ad_spend) AS total_ad_spend "
+            "FROM daily_ad_performance GROUP BY item_id ORDER BY total_ad_sales DESC LIMIT 10"),
+    ('daily', "SELECT date, SUM(total_sales) AS total_sales FROM daily_sales GROUP BY date ORDER BY date"),
+    ('day', "SELECT date, SUM(total_sales) AS total_sales FROM daily_sales GROUP BY date ORDER BY date"),
+    ('trend', "SELECT date, SUM(total_sales) AS total_sales FROM daily_sales GROUP BY date ORDER BY date"),
+]
+STUB_DEFAULT = "SELECT item_id, total_lifetime_sales FROM products ORDER BY total_lifetime_sales DESC LIMIT 10"
+
+
+class StubBackend:
+    """Offline, rule-based stand-in for load tests and air-gapped benchmarks.
+
+    Answers with the intent matcher's SQL or a canned query picked by keyword,
+    after an injected delay, and fails a configurable fraction of calls.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms=50, jitter_ms=0, error_rate=0.0, seed=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.intents = IntentMatcher()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def warmup(self):
+        pass
+
+    def plan(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+
+    def answer(self, question):
+        text = self.intents.match(question)
+        if text is None:
+            lowered = f" {question.lower()} "
+            text = next((sql for keyword, sql in STUB_RULES if keyword in lowered), STUB_DEFAULT)
+        return text
+
+    def complete(self, prompt, question, stop=None):
+        delay, failed = self.plan()
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise LLMBackendError("Stub backend injected failure")
+
+        text = self.answer(question)
+        return {
+            'text': text,
+            'prompt_tokens': len(prompt) // 4,
+            'completion_tokens': len(text) // 4,
+        }
+
+    def stream(self, prompt, question, stop=None):
+        """Yield the canned SQL word by word, spreading the injected delay across the words"""
+        delay, failed = self.plan()
+        if failed:
+            raise LLMBackendError("Stub backend injected failure")
+        text = self.answer(question)
+        pieces = re.findall(r"\S+\s*", text)
+        for piece in pieces:
+            if delay > 0:
+                time.sleep(delay / len(pieces))
+            yield piece
+        return {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(text) // 4}
+
+
+def create_backend(name=None):
+    """Build the SQL generation backend selected by LLM_BACKEND (groq or stub)"""
+    name = (name or os.getenv("LLM_BACKEND", "groq")).lower()
+    if name == "groq":
+        return GroqBackend(
+            model=os.getenv("LLM_MODEL", "llama-3.1-8b-instant"),
+            api_key=os.getenv("GROQ_API_KEY")
+        )
+    if name == "stub":
+        seed = os.getenv("STUB_SEED")
+        return StubBackend(
+            latency_ms=float(os.getenv("STUB_LATENCY_MS", "50")),
+            jitter_ms=float(os.getenv("STUB_JITTER_MS", "0")),
+            error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None
+        )
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
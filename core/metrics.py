@@ -0,0 +1,158 @@
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; covers sub-millisecond cache hits up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one label"""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, series in sorted(self._series.items()):
+                label = f'{self.label}="{escape_label(value)}"'
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label}}} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{{{label}}} {series['count']}")
+        return "\n".join(lines)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metric(name, kind, help_text, samples):
+    """Render a gauge or counter; samples is a list of (labels dict, value)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    "ecommerce_stage_seconds", "Time spent in each stage of answering a question", "stage"
+)
+REQUEST_SECONDS = Histogram(
+    "ecommerce_request_seconds", "End-to-end API request latency", "endpoint"
+)
+
+
+class RequestTimings:
+    """Per-request stage durations, plus the question and SQL for the slow-query log"""
+
+    def __init__(self):
+        self.stages = {}
+        self.question = None
+        self.sql = None
+        # (engine, statement) for each query actually run, after rewriting and wrapping
+        self.executed = []
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items())
+
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def request_scope():
+    """Reuse the timings of the enclosing request, or start new ones"""
+    timings = _current.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def record(stage, seconds, timings=None):
+    """Add a stage duration to the stage histogram and to the given or current request's timings"""
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = timings or _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextlib.contextmanager
+def timed(stage, timings=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started, timings)
+
+
+class SlowQueryLog:
+    """Records the question, SQL, stage timings and query plan of requests with a slow stage.
+
+    Entries are appended as JSON lines to `path` when set, otherwise logged as warnings.
+    """
+
+    def __init__(self, threshold_ms=1000, path=None):
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self.entries = 0
+        self._lock = threading.Lock()
+
+    def is_slow(self, timings):
+        # time spent waiting on another request's shared call is logged once, by the request that made it
+        return any(seconds >= self.threshold for stage, seconds in timings.stages.items()
+                   if not stage.endswith("_coalesced"))
+
+    def record(self, timings, plan):
+        entry = {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'question': timings.question,
+            'sql': timings.sql,
+            'stages_ms': {stage: round(seconds * 1000, 1) for stage, seconds in timings.stages.items()},
+            'query_plan': plan,
+        }
+        with self._lock:
+            self.entries += 1
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+        if not self.path:
+            logger.warning("Slow query: %s", json.dumps(entry, default=str))
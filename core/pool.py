@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+
+class ReadOnlyPool:
+    """Shared pool of read-only SQLite connections with tuned pragmas.
+
+    Every query the agent runs (schema introspection and generated SQL) borrows
+    a connection from here, so page caches and mmap regions are reused across
+    questions. SQLAlchemy's QueuePool is imported and built on the first
+    connection, not at start-up.
+    """
+
+    def __init__(self, db_path, size=4, max_overflow=4, mmap_mb=256, cache_mb=64, timeout=30):
+        self.db_path = db_path
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.mmap_bytes = int(mmap_mb * 1024 * 1024)
+        self.cache_kb = int(cache_mb * 1024)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                from sqlalchemy.pool import QueuePool
+
+                self._pool = QueuePool(self._connect, pool_size=self.size, max_overflow=self.max_overflow,
+                                       timeout=self.timeout)
+            return self._pool
+
+    def _connect(self):
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_bytes}")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_kb}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        proxy = self._get_pool().connect()
+        try:
+            yield proxy.dbapi_connection
+        finally:
+            proxy.close()
+
+    def opened(self):
+        """Connections currently open, idle or checked out"""
+        if self._pool is None:
+            return 0
+        return self._pool.checkedin() + self._pool.checkedout()
+
+    def status(self):
+        return self._pool.status() if self._pool is not None else "not started"
+
+    def dispose(self):
+        if self._pool is not None:
+            self._pool.dispose()
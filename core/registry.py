@@ -0,0 +1,150 @@
+import collections
+import os
+import re
+import threading
+import time
+
+from core.agent import EcommerceAIAgent
+from core.llm import create_backend
+from core.singleflight import SingleFlight
+
+# Letters, digits, '_', '-' and '.', starting with a letter or digit: safe to put into a file path
+TENANT_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Memory is re-measured at most this often (and whenever a tenant is added), not on every lookup
+BUDGET_CHECK_S = 1.0
+
+
+class UnknownTenant(LookupError):
+    """Raised for a tenant id that is malformed or has no database"""
+
+
+class AgentRegistry:
+    """One agent per tenant database, built on first use and sharing a single LLM client.
+
+    `pattern` maps a tenant id to its database path through `{tenant}`, e.g.
+    tenants/{tenant}/ecommerce_optimized.db. Each agent keeps its own
+    connection pool and caches; when there are more than `max_tenants` of them
+    or their estimated memory exceeds `max_bytes`, the least recently used
+    ones are closed. The default agent (no tenant) is never evicted.
+    """
+
+    def __init__(self, default_path="ecommerce_optimized.db", pattern=None, max_tenants=256,
+                 max_bytes=1024 * 1024 * 1024, llm=None):
+        self.pattern = pattern
+        self.max_tenants = max_tenants
+        self.max_bytes = max_bytes
+        self.llm = llm or create_backend()
+        self.default = EcommerceAIAgent(default_path, llm=self.llm)
+        self._agents = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._building = SingleFlight("tenant")
+        self._checked = 0.0
+        self._retired_usage = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'seconds': 0.0}
+        self.memory = 0
+        self.counts = {'hits': 0, 'created': 0, 'evicted': 0}
+
+    def path_for(self, tenant):
+        if not self.pattern:
+            raise UnknownTenant("Tenant routing is not configured (set TENANT_DB_PATH)")
+        if not TENANT_ID.match(tenant):
+            raise UnknownTenant(f"Invalid tenant id: {tenant!r}")
+        path = self.pattern.replace("{tenant}", tenant)
+        if not os.path.isfile(path):
+            raise UnknownTenant(f"No database for tenant {tenant!r}")
+        return path
+
+    def get(self, tenant=None):
+        """The agent for `tenant` (the default agent for None), built on first use"""
+        if tenant is None:
+            return self.default
+        with self._lock:
+            agent = self._agents.get(tenant)
+            if agent is not None:
+                self._agents.move_to_end(tenant)
+                self.counts['hits'] += 1
+        if agent is None:
+            agent = self._building.do(tenant, lambda: self._build(tenant))
+        self._enforce_budget(keep=tenant)
+        return agent
+
+    def loaded(self, tenant=None):
+        """The agent for `tenant` if it is loaded and no budget check is due, without blocking; else None (use get)"""
+        if tenant is None:
+            return self.default
+        with self._lock:
+            agent = self._agents.get(tenant)
+            if agent is None or time.monotonic() - self._checked >= BUDGET_CHECK_S:
+                return None
+            self._agents.move_to_end(tenant)
+            self.counts['hits'] += 1
+            return agent
+
+    def _build(self, tenant):
+        with self._lock:
+            agent = self._agents.get(tenant)
+            if agent is not None:
+                return agent
+        agent = EcommerceAIAgent(self.path_for(tenant), llm=self.llm, tenant=tenant)
+        with self._lock:
+            self._agents[tenant] = agent
+            self.counts['created'] += 1
+            self._checked = 0.0
+        return agent
+
+    def _enforce_budget(self, keep):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._agents) <= self.max_tenants and now - self._checked < BUDGET_CHECK_S:
+                return
+            self._checked = now
+            agents = list(self._agents.items())
+        sizes = {tenant: agent.memory_bytes() for tenant, agent in agents}
+        total = self.default.memory_bytes() + sum(sizes.values())
+        evicted = []
+        with self._lock:
+            # oldest first; the tenant being served stays even if it alone is over budget
+            for tenant in list(self._agents):
+                if len(self._agents) <= self.max_tenants and total <= self.max_bytes:
+                    break
+                if tenant == keep:
+                    continue
+                evicted.append(self._retire(tenant))
+                total -= sizes.get(tenant, 0)
+            self.memory = total
+        for agent in evicted:
+            agent.close()
+
+    def _retire(self, tenant):
+        agent = self._agents.pop(tenant)
+        self.counts['evicted'] += 1
+        for key, value in agent.llm_usage.items():
+            self._retired_usage[key] += value
+        return agent
+
+    def evict(self, tenant):
+        """Close a tenant's agent now, e.g. after its database was replaced; it is rebuilt on next use"""
+        with self._lock:
+            agent = self._retire(tenant) if tenant in self._agents else None
+        if agent is not None:
+            agent.close()
+
+    def agents(self):
+        """The default agent and every tenant agent currently loaded"""
+        with self._lock:
+            return [self.default] + list(self._agents.values())
+
+    def llm_usage(self):
+        """LLM usage of every agent since start, including evicted ones"""
+        with self._lock:
+            usage = dict(self._retired_usage)
+            agents = [self.default] + list(self._agents.values())
+        for agent in agents:
+            for key, value in agent.llm_usage.items():
+                usage[key] += value
+        return usage
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, tenants=len(self._agents), max_tenants=self.max_tenants,
+                        memory_bytes=self.memory, max_bytes=self.max_bytes)
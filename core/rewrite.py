@@ -0,0 +1,270 @@
+import re
+import threading
+from datetime import date, timedelta
+
+from data.processor import EcommerceDataProcessor
+
+STATEMENT = re.compile(
+    r"^SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<table>\w+)"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>\w+))?"
+    r"(?:\s+HAVING\s+(?P<having>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?$",
+    re.IGNORECASE | re.DOTALL
+)
+
+CONDITION = re.compile(
+    r"\s*(?:"
+    r"date\s+BETWEEN\s+'(?P<low>\d{4}-\d{2}-\d{2})'\s+AND\s+'(?P<high>\d{4}-\d{2}-\d{2})'"
+    r"|date\s*(?P<op>>=|<=|>|<|=)\s*'(?P<day>\d{4}-\d{2}-\d{2})'"
+    r"|(?P<item>item_id\s*(?:=\s*\d+|IN\s*\(\s*\d+(?:\s*,\s*\d+)*\s*\)))"
+    r")\s*(?:AND\b|$)",
+    re.IGNORECASE
+)
+
+# The pagination and row-count wrappers EcommerceAIAgent.run_page puts around a statement
+PAGE = re.compile(
+    r"^SELECT\s+\*\s+FROM\s+\((?P<inner>.+)\)\s+LIMIT\s+(?P<limit>\d+)\s+OFFSET\s+(?P<offset>\d+)\s*;?$",
+    re.IGNORECASE | re.DOTALL
+)
+COUNT_WRAPPER = re.compile(r"^SELECT\s+COUNT\(\*\)\s+FROM\s+\((?P<inner>.+)\)\s*;?$", re.IGNORECASE | re.DOTALL)
+
+AGGREGATE = re.compile(r"\b(SUM|AVG|COUNT)\s*\(\s*(\*|\w+)\s*\)", re.IGNORECASE)
+ALIAS = re.compile(r"^(?P<expr>.+?)(?:\s+AS\s+(?P<alias>\w+|\"[^\"]+\"))?$", re.IGNORECASE | re.DOTALL)
+UNSUPPORTED = re.compile(r"\bJOIN\b|\bUNION\b|\bDISTINCT\b|\bWITH\b|\(\s*SELECT\b|[A-Za-z_]\w*\s*\.\s*[A-Za-z_]|--|/\*", re.IGNORECASE)
+ALLOWED_WORDS = {'round', 'asc', 'desc', 'nulls', 'first', 'last', 'and', 'or', 'not'}
+
+
+def unwrap(sql_query):
+    """Peel the agent's pagination and row-count wrappers: (inner sql, page limit, page offset, count_only)"""
+    match = COUNT_WRAPPER.match(sql_query.strip())
+    if match:
+        return match.group('inner'), None, 0, True
+    match = PAGE.match(sql_query.strip())
+    if match:
+        return match.group('inner'), int(match.group('limit')), int(match.group('offset')), False
+    return sql_query, None, 0, False
+
+
+def wrap(sql_query, limit=None, offset=0, count_only=False):
+    """Inverse of unwrap()"""
+    if count_only:
+        return f"SELECT COUNT(*) FROM ({sql_query})"
+    if limit is not None:
+        return f"SELECT * FROM ({sql_query}) LIMIT {limit} OFFSET {offset}"
+    return sql_query
+
+
+def split_top_level(text):
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+class RollupRewriter:
+    """Redirects simple aggregate queries over the daily tables to the smallest exact rollup.
+
+    Eligible queries read one daily table, aggregate metrics with SUM/AVG/COUNT,
+    group by nothing, item_id (weekly/monthly rollups) or date (daily totals),
+    and filter only on item_id or on date bounds aligned to the rollup's periods.
+    Anything else is returned unchanged.
+    """
+
+    def __init__(self):
+        self.rollups = EcommerceDataProcessor.rollup_tables()
+        self.grains = EcommerceDataProcessor.ROLLUP_GRAINS
+        self.metrics = EcommerceDataProcessor.ROLLUP_SOURCES
+        self.version = None
+        self.row_counts = {}
+        self.columns = {}
+        self.rewrites = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, conn, version):
+        """Reload which rollup tables exist and how large they are, once per data version"""
+        if version == self.version:
+            return
+        existing = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        row_counts = {}
+        for name in self.rollups:
+            if name in existing:
+                row_counts[name] = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+        # Column names of each daily table and its rollups, which a SELECT alias must not shadow
+        columns = {}
+        for name in list(self.metrics) + list(row_counts):
+            source = self.rollups[name][0] if name in self.rollups else name
+            names = {row[1].lower() for row in conn.execute(f"PRAGMA table_info({name})")}
+            columns[source] = columns.get(source, set()) | names
+        with self._lock:
+            self.row_counts = row_counts
+            self.columns = columns
+            self.version = version
+
+    def rewrite(self, sql_query, conn, version):
+        self.refresh(conn, version)
+        # /ask pages and counts arrive wrapped; the statement inside is what can move to a rollup
+        inner, limit, offset, count_only = unwrap(sql_query)
+        rewritten = self.rewrite_statement(inner)
+        if rewritten is None:
+            return sql_query
+        with self._lock:
+            self.rewrites += 1
+        return wrap(rewritten, limit, offset, count_only)
+
+    def rewrite_statement(self, sql_query):
+        if UNSUPPORTED.search(sql_query):
+            return None
+        match = STATEMENT.match(sql_query.strip())
+        if not match or match.group('table').lower() not in self.metrics:
+            return None
+        source = match.group('table').lower()
+        group = (match.group('group') or '').lower()
+        if group not in ('', 'item_id', 'date'):
+            return None
+
+        bounds = self.parse_where(match.group('where'))
+        if bounds is None:
+            return None
+        low, high, filters_items = bounds
+
+        aliases = set()
+        select = []
+        for item in split_top_level(match.group('select')):
+            parts = ALIAS.match(item)
+            expr, alias = parts.group('expr').strip(), parts.group('alias')
+            if expr.lower() in ('item_id', 'date'):
+                if expr.lower() != group:
+                    return None
+                select.append(item)
+                continue
+            if not AGGREGATE.search(expr):
+                return None
+            rewritten = self.rewrite_expression(expr, source)
+            if rewritten is None:
+                return None
+            if alias:
+                aliases.add(alias.strip('"').lower())
+            select.append(f"{rewritten} AS {alias or self.quote(expr)}")
+
+        # An alias named like a column (SUM(total_sales) AS total_sales) resolves to the bare
+        # column in HAVING, which holds different values in a rollup: leave such queries alone
+        aliases -= self.columns.get(source, set())
+        clauses = {}
+        for clause in ('having', 'order'):
+            text = match.group(clause)
+            if text:
+                allowed = aliases | {group} if group else aliases
+                clauses[clause] = self.rewrite_expression(text, source, allowed)
+                if clauses[clause] is None:
+                    return None
+
+        grains = self.candidate_grains(group, filters_items, low, high)
+        candidates = [
+            f"{source}_{grain}" for grain in grains if f"{source}_{grain}" in self.row_counts
+        ]
+        if not candidates:
+            return None
+        rollup = min(candidates, key=lambda name: self.row_counts[name])
+
+        rewritten = f"SELECT {', '.join(select)} FROM {rollup}"
+        if match.group('where'):
+            rewritten += f" WHERE {match.group('where')}"
+        if group:
+            rewritten += f" GROUP BY {group}"
+        if 'having' in clauses:
+            rewritten += f" HAVING {clauses['having']}"
+        if 'order' in clauses:
+            rewritten += f" ORDER BY {clauses['order']}"
+        if match.group('limit'):
+            rewritten += f" LIMIT {match.group('limit')}"
+        return rewritten
+
+    def parse_where(self, where):
+        """Return half-open date bounds and whether item_id is filtered, or None if unsupported"""
+        low, high, filters_items = None, None, False
+        if not where:
+            return low, high, filters_items
+        position = 0
+        while position < len(where):
+            condition = CONDITION.match(where, position)
+            if not condition or condition.end() == position:
+                return None
+            position = condition.end()
+            if condition.group('item'):
+                filters_items = True
+                continue
+            if condition.group('low'):
+                lower = date.fromisoformat(condition.group('low'))
+                upper = date.fromisoformat(condition.group('high')) + timedelta(days=1)
+            else:
+                day = date.fromisoformat(condition.group('day'))
+                op = condition.group('op')
+                lower = {'>=': day, '>': day + timedelta(days=1), '=': day}.get(op)
+                upper = {'<': day, '<=': day + timedelta(days=1), '=': day + timedelta(days=1)}.get(op)
+            if lower is not None:
+                low = lower if low is None else max(low, lower)
+            if upper is not None:
+                high = upper if high is None else min(high, upper)
+        return low, high, filters_items
+
+    def rewrite_expression(self, expr, source, allowed_words=()):
+        """Swap each aggregate for its rollup equivalent; reject bare column references"""
+        invalid = False
+
+        def replace(aggregate):
+            nonlocal invalid
+            function, column = aggregate.group(1).upper(), aggregate.group(2).lower()
+            if column != '*' and column not in self.metrics[source]:
+                invalid = True
+                return aggregate.group(0)
+            if function == 'SUM' and column != '*':
+                return f"SUM({column})"
+            if function == 'COUNT':
+                return "COALESCE(SUM(row_count), 0)" if column == '*' else f"COALESCE(SUM({column}_count), 0)"
+            if function == 'AVG' and column != '*':
+                return f"(CAST(SUM({column}) AS REAL) / SUM({column}_count))"
+            invalid = True
+            return aggregate.group(0)
+
+        rewritten = AGGREGATE.sub(replace, expr)
+        remainder = AGGREGATE.sub("0", expr)
+        remainder = re.sub(r"'[^']*'|\"[^\"]*\"", "0", remainder)
+        for word in re.findall(r"[A-Za-z_]\w*", remainder):
+            if word.lower() not in ALLOWED_WORDS and word.lower() not in allowed_words:
+                invalid = True
+        return None if invalid else rewritten
+
+    def candidate_grains(self, group, filters_items, low, high):
+        if group == 'date':
+            return [] if filters_items else ['totals']
+        grains = []
+        if group != 'item_id' and not filters_items:
+            grains.append('totals')
+        if self.aligned(low, high, lambda day: day.day == 1):
+            grains.append('monthly')
+        if self.aligned(low, high, lambda day: day.weekday() == 0):
+            grains.append('weekly')
+        return grains
+
+    @staticmethod
+    def aligned(low, high, is_period_start):
+        return all(bound is None or is_period_start(bound) for bound in (low, high))
+
+    @staticmethod
+    def quote(expr):
+        return '"' + expr.replace('"', '""') + '"'
+
+    def stats(self):
+        with self._lock:
+            return {'rewrites': self.rewrites, 'rollups': dict(self.row_counts)}
@@ -0,0 +1,124 @@
+import re
+import threading
+
+# column -> phrases in a question that suggest the column is needed
+COLUMN_KEYWORDS = {
+    'roas': ('roas', 'return on ad spend'),
+    'cpc': ('cpc', 'cost per click'),
+    'ctr': ('ctr', 'click-through', 'click through'),
+    'clicks': ('click',),
+    'impressions': ('impression',),
+    'ad_spend': ('spend', 'cost', 'budget'),
+    'ad_sales': ('ad sales', 'ad revenue', 'advertising sales'),
+    'units_sold': ('units sold',),
+    'total_sales': ('sales', 'revenue'),
+    'total_units_ordered': ('units', 'ordered', 'orders'),
+    'total_lifetime_sales': ('lifetime', 'total sales', 'sales', 'revenue'),
+    'total_lifetime_ad_sales': ('lifetime ad', 'ad sales'),
+    'first_sale_date': ('first sale', 'first sold', 'launched', 'oldest'),
+    'last_sale_date': ('last sale', 'last sold', 'recent', 'latest'),
+    'is_currently_eligible': ('eligib',),
+    'is_eligible': ('eligib',),
+    'eligibility_datetime_utc': ('eligib',),
+    'message': ('message', 'reason', 'why'),
+    'avg_roas': ('roas', 'return on ad spend'),
+    'avg_cpc': ('cpc', 'cost per click'),
+    'max_cpc': ('cpc', 'cost per click'),
+    'sales_rank': ('rank',),
+}
+
+# table or view -> phrases that make it relevant even when no column keyword matches
+TABLE_KEYWORDS = {
+    'products': ('product', 'item', 'lifetime'),
+    'daily_sales': ('daily', 'day', 'date', 'week', 'month', 'trend', 'over time'),
+    'daily_ad_performance': ('ad ', 'ads', 'advert', 'campaign', 'daily', 'day', 'date', 'week', 'month', 'trend'),
+    'product_eligibility': ('eligib',),
+}
+
+# Columns that join or order results and are kept whenever their table is included
+KEY_COLUMNS = {'item_id', 'date'}
+
+
+class SchemaContext:
+    """Schema description for the SQL prompt, introspected once per data version.
+
+    `table_info(question)` returns only the tables, views and columns the
+    question plausibly needs, falling back to every table when nothing matches.
+    """
+
+    def __init__(self, exclude=(), sample_rows=3):
+        self.exclude = set(exclude)
+        self.sample_rows = sample_rows
+        self.version = None
+        self.objects = {}
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, conn, version):
+        if version == self.version:
+            return
+        objects = {}
+        rows = conn.execute(
+            "SELECT name, type FROM sqlite_master "
+            "WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+        for name, kind in rows:
+            if name in self.exclude:
+                continue
+            columns = [(col[1], col[2]) for col in conn.execute(f'PRAGMA table_info("{name}")')]
+            samples = conn.execute(f'SELECT * FROM "{name}" LIMIT {int(self.sample_rows)}').fetchall()
+            objects[name] = {'kind': kind, 'columns': columns, 'samples': samples}
+        with self._lock:
+            self.objects = objects
+            self._rendered = {}
+            self.version = version
+
+    def select(self, question):
+        """Map each relevant table or view to the columns to show (None means all columns)"""
+        text = f" {' '.join(question.lower().split())} "
+        selected = {}
+        for name, info in self.objects.items():
+            matched = [
+                column for column, _ in info['columns']
+                if any(keyword in text for keyword in COLUMN_KEYWORDS.get(column, ()))
+            ]
+            table_hit = any(keyword in text for keyword in TABLE_KEYWORDS.get(name, ()))
+            if info['kind'] == 'view':
+                # Views are only offered when one of their aggregate columns is asked for
+                if matched and any(c not in KEY_COLUMNS for c in matched):
+                    selected[name] = None
+            elif matched:
+                selected[name] = tuple(c for c, _ in info['columns'] if c in KEY_COLUMNS or c in matched)
+            elif table_hit:
+                selected[name] = None
+        if not any(self.objects[name]['kind'] == 'table' for name in selected):
+            selected = {name: None for name, info in self.objects.items() if info['kind'] == 'table'}
+        return selected
+
+    def render(self, name, columns=None):
+        with self._lock:
+            key = (self.version, name, columns)
+            if key in self._rendered:
+                return self._rendered[key]
+            info = self.objects[name]
+        indexes = [i for i, (column, _) in enumerate(info['columns']) if columns is None or column in columns]
+        keyword = "VIEW" if info['kind'] == 'view' else "TABLE"
+        definition = ", \n".join(
+            f"\t{info['columns'][i][0]} {info['columns'][i][1] or ''}".rstrip() for i in indexes
+        )
+        header = "\t".join(info['columns'][i][0] for i in indexes)
+        samples = "\n".join(
+            "\t".join(re.sub(r"\s+", " ", str(row[i]))[:100] for i in indexes) for row in info['samples']
+        )
+        text = (
+            f"CREATE {keyword} {name} (\n{definition}\n)\n\n"
+            f"/*\n{len(info['samples'])} rows from {name} {keyword.lower()}:\n{header}\n{samples}\n*/"
+        )
+        with self._lock:
+            self._rendered[key] = text
+        return text
+
+    def table_info(self, question):
+        """Return the pruned schema text and the names of the objects it covers"""
+        selected = self.select(question)
+        return "\n\n".join(self.render(name, columns) for name, columns in selected.items()), list(selected)
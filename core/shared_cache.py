@@ -0,0 +1,152 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SharedCacheStore:
+    """Question → SQL and query result cache in a local SQLite file, shared by every worker process.
+
+    SQL is stored per schema fingerprint and results per data version, so a
+    worker never reads an entry built against other data. The first worker to
+    see a newer data version drops all older results in one transaction.
+    Results are pickled DataFrames: keep the file somewhere only this service
+    can write to.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_sql_entries=4096, ttl=3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_sql_entries = max_sql_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        with self._connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    question TEXT, schema TEXT, sql TEXT, stored_at REAL,
+                    PRIMARY KEY (question, schema)
+                );
+                CREATE TABLE IF NOT EXISTS results (
+                    sql TEXT, version TEXT, data BLOB, size INTEGER, stored_at REAL,
+                    PRIMARY KEY (sql, version)
+                );
+                CREATE INDEX IF NOT EXISTS results_stored_at ON results (stored_at);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+
+    @contextmanager
+    def _connection(self):
+        # One connection per process, used by one thread at a time; one inherited across fork is never reused
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode = WAL")
+                self._conn.execute("PRAGMA synchronous = NORMAL")
+                self._pid = os.getpid()
+            yield self._conn
+
+    def get_sql(self, question, schema):
+        """(sql, stored_at) for a normalized question under this schema fingerprint, or None"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT sql, stored_at FROM sql_cache WHERE question = ? AND schema = ?",
+                               (question, schema)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return row
+
+    def set_sql(self, question, schema, sql):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?, ?)", (question, schema, sql, time.time()))
+            conn.execute("""DELETE FROM sql_cache WHERE rowid IN (
+                                SELECT rowid FROM sql_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)""",
+                         (self.max_sql_entries,))
+
+    def check_version(self, version):
+        """Drop every stored result once any worker sees a different data version.
+
+        Any change counts, not just a higher one: a database rebuilt from scratch
+        starts its schema_version and user_version again from low values.
+        """
+        current = list(version)
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+                stored = json.loads(row[0]) if row else None
+                if current != stored:
+                    if stored is not None:
+                        conn.execute("DELETE FROM results")
+                        self.invalidations += 1
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('data_version', ?)",
+                                 (json.dumps(current),))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get_result(self, sql, version):
+        with self._connection() as conn:
+            row = conn.execute("SELECT data FROM results WHERE sql = ? AND version = ?",
+                               (sql, repr(tuple(version)))).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set_result(self, sql, version, df):
+        data = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                             (sql, repr(tuple(version)), data, len(data), time.time()))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                # Oldest first; reads never write, so workers don't contend on hits
+                for rowid, size in conn.execute("SELECT rowid, size FROM results ORDER BY stored_at").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM results WHERE rowid = ?", (rowid,))
+                    total -= size
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM sql_cache")
+
+    def stats(self):
+        with self._connection() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            sql_entries = conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        total = hits + misses
+        return {
+            'entries': entries,
+            'sql_entries': sql_entries,
+            'bytes': size,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+            'invalidations': invalidations,
+        }
+
@@ -0,0 +1,210 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from core.metrics import record
+
+# Set per request (e.g. by StageLimiter) so waits can be cancelled without passing the token down every call
+cancel_token = contextvars.ContextVar("cancel_token", default=None)
+
+
+class CoalesceTimeout(TimeoutError):
+    """Raised to a waiter whose own timeout ran out before the shared call finished"""
+
+
+class Cancelled(Exception):
+    """Raised to a waiter whose request was cancelled while it waited"""
+
+
+class Abandoned(Exception):
+    """The leader stopped before producing a result; its waiters start over"""
+
+
+class CancelToken:
+    """Cancels every wait made by one request; the shared call itself keeps running for the others"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakes = set()
+        self.cancelled = False
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            wakes = list(self._wakes)
+        for wake in wakes:
+            wake.set()
+
+    def register(self, wake):
+        with self._lock:
+            if self.cancelled:
+                wake.set()
+            else:
+                self._wakes.add(wake)
+
+    def unregister(self, wake):
+        with self._lock:
+            self._wakes.discard(wake)
+
+
+class Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = False
+        self.result = None
+        self.error = None
+        self.waiters = []
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs wait for its result.
+
+    The first caller (the leader) does the work on its own thread. Every waiter
+    has its own timeout and can be cancelled through the current CancelToken;
+    giving up never affects the leader or the other waiters. A leader's
+    exception is raised to its waiters too, except when the leader was
+    interrupted, in which case one of them takes over.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.counts = {'leaders': 0, 'coalesced': 0, 'timeouts': 0, 'cancelled': 0}
+
+    def do(self, key, func, timeout=None):
+        while True:
+            call, leader = self.begin(key)
+            if not leader:
+                try:
+                    return self.wait(call, timeout)
+                except Abandoned:
+                    continue
+            try:
+                result = func()
+            except BaseException as e:
+                self.finish(key, call, error=e)
+                raise
+            self.finish(key, call, result=result)
+            return result
+
+    def begin(self, key):
+        """Return (call, True) if the caller should run the call, or (call, False) to wait for it"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.counts['coalesced'] += 1
+                return call, False
+            call = self._calls[key] = Call()
+            self.counts['leaders'] += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        if error is not None and not isinstance(error, Exception):
+            # GeneratorExit, KeyboardInterrupt and the like: nothing to share
+            error = Abandoned()
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.done, call.result, call.error = True, result, error
+            waiters, call.waiters = call.waiters, []
+        for wake in waiters:
+            wake.set()
+
+    def join(self, key, timeout=None):
+        """Wait for the call in flight for `key`; (False, None) if there is none or its leader gave up"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                return False, None
+            self.counts['coalesced'] += 1
+        try:
+            return True, self.wait(call, timeout)
+        except Abandoned:
+            return False, None
+
+    def wait(self, call, timeout=None):
+        started = time.perf_counter()
+        wake = threading.Event()
+        with self._lock:
+            if not call.done:
+                call.waiters.append(wake)
+        token = cancel_token.get()
+        if token is not None:
+            token.register(wake)
+        try:
+            woken = call.done or wake.wait(timeout)
+        finally:
+            if token is not None:
+                token.unregister(wake)
+        with self._lock:
+            done = call.done
+            if not done:
+                call.waiters.remove(wake)
+                self.counts['cancelled' if woken else 'timeouts'] += 1
+        record(f"{self.name}_coalesced", time.perf_counter() - started)
+        if not done:
+            if woken:
+                raise Cancelled(f"Request cancelled while waiting for a shared {self.name} call")
+            raise CoalesceTimeout(f"Timed out after {timeout}s waiting for a shared {self.name} call")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, in_flight=len(self._calls))
+
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of SingleFlight for the API.
+
+    Callers of an identical call already in flight await the leader's future on
+    the loop, so they hold no thread and no stage slot while they wait. A
+    waiter that times out or is cancelled only stops waiting; if the leader is
+    cancelled, one of its waiters takes over.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self.counts = {'leaders': 0, 'coalesced': 0, 'timeouts': 0, 'cancelled': 0}
+
+    async def do(self, key, start, timeout=None):
+        """Await `start()` (a coroutine function) once per key among concurrent callers"""
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self.counts['coalesced'] += 1
+            started = time.perf_counter()
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except Abandoned:
+                continue
+            except asyncio.TimeoutError:
+                self.counts['timeouts'] += 1
+                raise CoalesceTimeout(f"Timed out after {timeout}s waiting for a shared {self.name} call")
+            except asyncio.CancelledError:
+                self.counts['cancelled'] += 1
+                raise
+            finally:
+                record(f"{self.name}_coalesced", time.perf_counter() - started)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.counts['leaders'] += 1
+        try:
+            result = await start()
+        except BaseException as e:
+            del self._calls[key]
+            future.set_exception(e if isinstance(e, Exception) else Abandoned())
+            future.exception()  # retrieved here, so an unawaited failure is not reported as lost
+            raise
+        del self._calls[key]
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        return dict(self.counts, in_flight=len(self._calls))
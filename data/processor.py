@@ -1,52 +1,98 @@
+import numpy as np
 import pandas as pd
 import sqlite3
+import json
 import os
+import shutil
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def safe_divide(numerator, denominator):
+    """Element-wise ratio that is 0 wherever the denominator is 0"""
+    numerator = numerator.to_numpy(dtype='float64', na_value=np.nan)
+    denominator = denominator.to_numpy(dtype='float64', na_value=np.nan)
+    out = np.zeros(len(numerator))
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
 
 class EcommerceDataProcessor:
-    def __init__(self, db_name="ecommerce_optimized.db"):
+    CSV_SOURCES = {
+        'total_sales': ('total_sales.csv', {
+            'date': str, 'item_id': 'Int64', 'total_sales': 'float64', 'total_units_ordered': 'Int64'
+        }),
+        'ad_sales': ('ad_sales.csv', {
+            'date': str, 'item_id': 'Int64', 'ad_sales': 'float64', 'impressions': 'Int64',
+            'ad_spend': 'float64', 'clicks': 'Int64', 'units_sold': 'Int64'
+        }),
+        'eligibility': ('eligibility.csv', {
+            'eligibility_datetime_utc': str, 'item_id': 'Int64', 'eligibility': str, 'message': str
+        }),
+    }
+    
+    # Parquet snapshots for core.columnar: <snapshot_dir>/v<schema>_<generation>/<table>.parquet
+    SNAPSHOT_POINTER = "CURRENT.json"
+    SNAPSHOTS_KEPT = 2
+    
+    def __init__(self, db_name="ecommerce_optimized.db", chunk_rows=100_000, data_dir="data", index_file=None,
+                 snapshot_dir=None):
         self.db_name = db_name
+        self.data_dir = data_dir
+        # Indexes accepted from core.advisor, rebuilt on every full load
+        self.index_file = index_file or f"{os.path.splitext(db_name)[0]}_indexes.json"
+        self.snapshot_dir = snapshot_dir
+        self.chunk_rows = chunk_rows
         self.conn = None
+        self.ingest_stats = None
     
     def connect_db(self):
-        self.conn = sqlite3.connect(self.db_name)
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_name)
+            # WAL lets the agent's read-only connections keep reading during a reload
+            self.conn.execute("PRAGMA journal_mode = WAL")
         return self.conn
     
+    def iter_source(self, name, analysis=None):
+        """Yield typed, fixed-size chunks of one CSV source, recording its shape and load rate in `analysis`"""
+        filename, dtypes = self.CSV_SOURCES[name]
+        path = os.path.join(self.data_dir, filename)
+        started = time.perf_counter()
+        entry = None
+        for chunk in pd.read_csv(path, dtype=dtypes, chunksize=self.chunk_rows):
+            if entry is None:
+                entry = {'shape': (0, chunk.shape[1]), 'columns': list(chunk.columns), 'dtypes': chunk.dtypes.to_dict()}
+                if analysis is not None:
+                    analysis[name] = entry
+            entry['shape'] = (entry['shape'][0] + len(chunk), chunk.shape[1])
+            yield chunk
+        if entry is not None:
+            entry['seconds'] = time.perf_counter() - started
+    
     def analyze_csv_files(self):
         print("Analyzing CSV data...")
         
-        files = {
-            'total_sales': 'data/total_sales.csv',
-            'ad_sales': 'data/ad_sales.csv', 
-            'eligibility': 'data/eligibility.csv'
-        }
-        
         analysis = {}
-        
-        for name, path in files.items():
-            df = pd.read_csv(path)
-            print(f"{name}: {df.shape[0]} rows, {df.shape[1]} columns")
-            
-            analysis[name] = {
-                'shape': df.shape,
-                'columns': list(df.columns),
-                'dtypes': df.dtypes.to_dict()
-            }
+        for name in self.CSV_SOURCES:
+            for _ in self.iter_source(name, analysis):
+                pass
+            rows, cols = analysis[name]['shape']
+            print(f"{name}: {rows} rows, {cols} columns")
         
         return analysis
     
-    def create_optimized_tables(self):
-        print("Creating database tables...")
-        
-        conn = self.connect_db()
-        cursor = conn.cursor()
-        
-        cursor.execute("DROP TABLE IF EXISTS products")
-        cursor.execute("DROP TABLE IF EXISTS daily_sales") 
-        cursor.execute("DROP TABLE IF EXISTS daily_ad_performance")
-        cursor.execute("DROP TABLE IF EXISTS product_eligibility")
-        
-        cursor.execute("""
-        CREATE TABLE products (
+    TABLE_DEFINITIONS = {
+        'products': """(
             item_id INTEGER PRIMARY KEY,
             first_sale_date DATE,
             last_sale_date DATE,
@@ -54,11 +100,8 @@ class EcommerceDataProcessor:
             total_lifetime_ad_sales DECIMAL(10,2),
             is_currently_eligible BOOLEAN,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        
-        cursor.execute("""
-        CREATE TABLE daily_sales (
+        )""",
+        'daily_sales': """(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date DATE NOT NULL,
             item_id INTEGER NOT NULL,
@@ -66,11 +109,8 @@ class EcommerceDataProcessor:
             total_units_ordered INTEGER DEFAULT 0,
             FOREIGN KEY (item_id) REFERENCES products(item_id),
             UNIQUE(date, item_id)
-        )
-        """)
-        
-        cursor.execute("""
-        CREATE TABLE daily_ad_performance (
+        )""",
+        'daily_ad_performance': """(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date DATE NOT NULL,
             item_id INTEGER NOT NULL,
@@ -84,51 +124,285 @@ class EcommerceDataProcessor:
             ctr DECIMAL(8,4),
             FOREIGN KEY (item_id) REFERENCES products(item_id),
             UNIQUE(date, item_id)
-        )
-        """)
-        
-        cursor.execute("""
-        CREATE TABLE product_eligibility (
+        )""",
+        'product_eligibility': """(
             item_id INTEGER PRIMARY KEY,
             eligibility_datetime_utc TIMESTAMP,
             is_eligible BOOLEAN,
             message TEXT,
             FOREIGN KEY (item_id) REFERENCES products(item_id)
-        )
-        """)
+        )""",
+    }
+    
+    INDEX_DEFINITIONS = [
+        "CREATE INDEX IF NOT EXISTS idx_daily_sales_date ON daily_sales(date)",
+        "CREATE INDEX IF NOT EXISTS idx_daily_sales_item ON daily_sales(item_id)",
+        "CREATE INDEX IF NOT EXISTS idx_ad_performance_date ON daily_ad_performance(date)",
+        "CREATE INDEX IF NOT EXISTS idx_ad_performance_item ON daily_ad_performance(item_id)",
+        "CREATE INDEX IF NOT EXISTS idx_ad_performance_roas ON daily_ad_performance(roas)",
+        "CREATE INDEX IF NOT EXISTS idx_ad_performance_cpc ON daily_ad_performance(cpc)",
+    ]
+    
+    # Per-item weekly/monthly rollups and global per-day totals for each daily table;
+    # every metric is stored as SUM plus a non-null COUNT so averages stay exact
+    ROLLUP_SOURCES = {
+        'daily_sales': ['total_sales', 'total_units_ordered'],
+        'daily_ad_performance': ['ad_sales', 'ad_spend', 'impressions', 'clicks', 'units_sold', 'roas', 'cpc', 'ctr'],
+    }
+    
+    # grain -> (expression giving the first day of the period, keyed by item_id)
+    ROLLUP_GRAINS = {
+        'weekly': ("date(date, '-6 days', 'weekday 1')", True),
+        'monthly': ("date(date, 'start of month')", True),
+        'totals': ("date", False),
+    }
+    
+    SALES_COLUMNS = ['date', 'item_id', 'total_sales', 'total_units_ordered']
+    AD_COLUMNS = ['date', 'item_id', 'ad_sales', 'ad_spend', 'impressions', 'clicks', 'units_sold', 'roas', 'cpc', 'ctr']
+    ELIGIBILITY_COLUMNS = ['item_id', 'eligibility_datetime_utc', 'is_eligible', 'message']
+    
+    def create_optimized_tables(self):
+        print("Creating database tables...")
+        
+        conn = self.connect_db()
+        cursor = conn.cursor()
+        
+        cursor.execute("DROP TABLE IF EXISTS products")
+        cursor.execute("DROP TABLE IF EXISTS daily_sales") 
+        cursor.execute("DROP TABLE IF EXISTS daily_ad_performance")
+        cursor.execute("DROP TABLE IF EXISTS product_eligibility")
+        
+        for name, definition in self.TABLE_DEFINITIONS.items():
+            cursor.execute(f"CREATE TABLE {name} {definition}")
+        
+        for name, (source, grain) in self.rollup_tables().items():
+            cursor.execute(f"DROP TABLE IF EXISTS {name}")
+            cursor.execute(f"CREATE TABLE {name} {self.rollup_definition(source, grain)}")
         
         conn.commit()
         print("Tables created successfully.")
         
-    def load_and_transform_data(self):
-        print("Loading data...")
+    def ensure_tables(self):
+        conn = self.connect_db()
+        for name, definition in self.TABLE_DEFINITIONS.items():
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {name} {definition}")
+        for name, (source, grain) in self.rollup_tables().items():
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {name} {self.rollup_definition(source, grain)}")
+        self.create_indexes(conn.cursor())
+        conn.commit()
         
+    @classmethod
+    def rollup_tables(cls):
+        """Map rollup table name (e.g. daily_sales_monthly) to its (source table, grain)"""
+        return {
+            f"{source}_{grain}": (source, grain)
+            for source in cls.ROLLUP_SOURCES
+            for grain in cls.ROLLUP_GRAINS
+        }
+        
+    def rollup_definition(self, source, grain):
+        _, per_item = self.ROLLUP_GRAINS[grain]
+        metrics = self.ROLLUP_SOURCES[source]
+        key = ['date', 'item_id'] if per_item else ['date']
+        columns = ["date DATE NOT NULL"] + (["item_id INTEGER NOT NULL"] if per_item else [])
+        columns += [f"{m} NUMERIC" for m in metrics]
+        columns += [f"{m}_count INTEGER" for m in metrics]
+        columns += ["row_count INTEGER", f"PRIMARY KEY ({', '.join(key)})"]
+        return "(\n            " + ",\n            ".join(columns) + "\n        )"
+        
+    def refresh_rollups(self, cursor, incremental=False):
+        """Rebuild every rollup, or with `incremental` only the periods holding rows in temp.touched_<source>"""
+        for name, (source, grain) in self.rollup_tables().items():
+            period, per_item = self.ROLLUP_GRAINS[grain]
+            metrics = self.ROLLUP_SOURCES[source]
+            keys = "date, item_id" if per_item else "date"
+            period_keys = f"{period}, item_id" if per_item else period
+            
+            where = "1 = 1"
+            if incremental and cursor.execute(f"SELECT 1 FROM {name} LIMIT 1").fetchone():
+                touched_periods = f"SELECT DISTINCT {period_keys} FROM temp.touched_{source}"
+                cursor.execute(f"DELETE FROM {name} WHERE ({keys}) IN ({touched_periods})")
+                where = (
+                    f"date >= (SELECT MIN({period}) FROM temp.touched_{source}) "
+                    f"AND ({period_keys}) IN ({touched_periods})"
+                )
+            else:
+                cursor.execute(f"DELETE FROM {name}")
+            
+            aggregates = [f"SUM({m})" for m in metrics] + [f"COUNT({m})" for m in metrics] + ["COUNT(*)"]
+            cursor.execute(f"""
+            INSERT INTO {name}
+            SELECT {period_keys}, {', '.join(aggregates)}
+            FROM {source}
+            WHERE {where}
+            GROUP BY {period_keys}
+            """)
+        
+    def create_indexes(self, cursor):
+        for statement in self.INDEX_DEFINITIONS:
+            cursor.execute(statement)
+        for statement in self.advised_indexes():
+            try:
+                cursor.execute(statement)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️  WARNING: skipping advised index ({e}): {statement}")
+        
+    def advised_indexes(self):
+        if not os.path.exists(self.index_file):
+            return []
+        with open(self.index_file, encoding="utf-8") as f:
+            return json.load(f)
+        
+    def apply_indexes(self, statements):
+        """Create indexes proposed by the index advisor and remember them so full reloads rebuild them"""
         conn = self.connect_db()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        saved = self.advised_indexes()
+        saved += [statement for statement in statements if statement not in saved]
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2)
+        os.replace(tmp_path, self.index_file)
+        print(f"Applied {len(statements)} advised indexes ({len(saved)} recorded in {self.index_file}).")
+        # New indexes change the schema version the columnar engine checks snapshots against
+        if self.snapshot_dir:
+            self.export_snapshot()
         
-        df_sales = pd.read_csv('data/total_sales.csv')
-        df_sales.to_sql('daily_sales', conn, if_exists='append', index=False)
+    @staticmethod
+    def arrow_type(declared):
+        import pyarrow as pa
+        declared = declared.upper()
+        if 'INT' in declared or declared == 'BOOLEAN':
+            return pa.int64()
+        if declared.startswith(('DECIMAL', 'REAL', 'FLOAT', 'DOUBLE', 'NUMERIC')):
+            return pa.float64()
+        return pa.string()
         
-        df_ads = pd.read_csv('data/ad_sales.csv')
+    def export_snapshot(self):
+        """Write the base tables to Parquet for core.columnar and point CURRENT.json at them"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("⚠️  WARNING: pyarrow is not installed; skipping the columnar snapshot")
+            return None
         
-        df_ads['roas'] = df_ads['ad_sales'] / df_ads['ad_spend'].replace(0, float('inf'))
-        df_ads['roas'] = df_ads['roas'].replace([float('inf'), float('-inf')], 0)
+        started = time.perf_counter()
+        conn = self.connect_db()
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        # One read transaction so every table and the version come from the same commit
+        conn.execute("BEGIN")
+        try:
+            version = [conn.execute("PRAGMA schema_version").fetchone()[0], conn.execute("PRAGMA user_version").fetchone()[0]]
+            name = f"v{version[0]}_{version[1]}"
+            tmp_dir = os.path.join(self.snapshot_dir, f"{name}.tmp")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            for table in self.TABLE_DEFINITIONS:
+                columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+                schema = pa.schema([(col[1], self.arrow_type(col[2])) for col in columns])
+                cursor = conn.execute(f"SELECT {', '.join(col[1] for col in columns)} FROM {table}")
+                with pq.ParquetWriter(os.path.join(tmp_dir, f"{table}.parquet"), schema) as writer:
+                    while True:
+                        rows = cursor.fetchmany(self.chunk_rows)
+                        if not rows:
+                            break
+                        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+                        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            print(f"⚠️  WARNING: columnar snapshot failed, keeping the previous one: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+        finally:
+            conn.rollback()
         
-        df_ads['cpc'] = df_ads['ad_spend'] / df_ads['clicks'].replace(0, float('inf'))
-        df_ads['cpc'] = df_ads['cpc'].replace([float('inf'), float('-inf')], 0)
+        target = os.path.join(self.snapshot_dir, name)
+        shutil.rmtree(target, ignore_errors=True)
+        os.rename(tmp_dir, target)
+        pointer = os.path.join(self.snapshot_dir, self.SNAPSHOT_POINTER)
+        with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+            json.dump({'version': version, 'path': name}, f)
+        os.replace(f"{pointer}.tmp", pointer)
         
-        df_ads['ctr'] = df_ads['clicks'] / df_ads['impressions'].replace(0, float('inf'))
-        df_ads['ctr'] = df_ads['ctr'].replace([float('inf'), float('-inf')], 0)
+        # Keep the previous snapshot too, for readers that picked it up before the switch
+        snapshots = [entry for entry in os.scandir(self.snapshot_dir) if entry.is_dir() and not entry.name.endswith(".tmp")]
+        snapshots.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in snapshots[self.SNAPSHOTS_KEPT:]:
+            if entry.name != name:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        print(f"Columnar snapshot {name} written in {time.perf_counter() - started:.1f}s")
+        return target
         
-        df_ads.to_sql('daily_ad_performance', conn, if_exists='append', index=False)
+    def add_ad_metrics(self, df_ads):
+        df_ads['roas'] = safe_divide(df_ads['ad_sales'], df_ads['ad_spend'])
+        df_ads['cpc'] = safe_divide(df_ads['ad_spend'], df_ads['clicks'])
+        df_ads['ctr'] = safe_divide(df_ads['clicks'], df_ads['impressions'])
+        return df_ads
         
-        df_eligibility = pd.read_csv('data/eligibility.csv')
-        df_eligibility['is_eligible'] = df_eligibility['eligibility'] == 'TRUE'
-        df_eligibility = df_eligibility.drop('eligibility', axis=1)
-        df_eligibility = df_eligibility.sort_values('eligibility_datetime_utc').groupby('item_id').last().reset_index()
-        df_eligibility.to_sql('product_eligibility', conn, if_exists='append', index=False)
+    def latest_eligibility(self, chunks):
+        """Reduce eligibility chunks to the most recent record per item"""
+        latest = None
+        for chunk in chunks:
+            chunk['is_eligible'] = chunk['eligibility'].astype(str).str.upper() == 'TRUE'
+            # Timestamps are not zero-padded in the export, so sort on parsed values rather than text
+            parsed = pd.to_datetime(chunk['eligibility_datetime_utc'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+            chunk['eligibility_datetime_utc'] = parsed.dt.strftime('%Y-%m-%d %H:%M:%S')
+            chunk = chunk.drop('eligibility', axis=1)
+            if latest is not None:
+                chunk = pd.concat([latest, chunk], ignore_index=True)
+            latest = chunk.sort_values('eligibility_datetime_utc', kind='stable').groupby('item_id').last().reset_index()
+        return latest
         
-        cursor = conn.cursor()
-        cursor.execute("""
+    def insert_rows(self, cursor, table, columns, df):
+        if df is None or df.empty:
+            return
+        placeholders = ", ".join("?" for _ in columns)
+        values = df[columns].astype(object).where(df[columns].notna(), None)
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+            values.itertuples(index=False, name=None)
+        )
+        
+    def begin_bulk_load(self, conn):
+        """Ingest-time pragmas; the previous durability setting is restored by end_bulk_load"""
+        self._synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        
+    def end_bulk_load(self, conn):
+        conn.execute(f"PRAGMA synchronous = {int(self._synchronous)}")
+        
+    def report_ingest(self, analysis, seconds):
+        total_rows = 0
+        for name, entry in analysis.items():
+            rows, cols = entry['shape']
+            total_rows += rows
+            rate = rows / entry['seconds'] if entry.get('seconds') else 0
+            print(f"{name}: {rows} rows, {cols} columns ({rate:,.0f} rows/sec)")
+        
+        peak = peak_rss_mb()
+        self.ingest_stats = {
+            'rows': total_rows,
+            'seconds': seconds,
+            'rows_per_sec': total_rows / seconds if seconds else 0,
+            'peak_rss_mb': peak
+        }
+        peak_text = f", peak RSS {peak:,.0f} MB" if peak is not None else ""
+        print(f"Ingested {total_rows} rows in {seconds:.2f}s ({self.ingest_stats['rows_per_sec']:,.0f} rows/sec{peak_text})")
+        
+    def refresh_products(self, cursor, item_filter="1 = 1"):
+        """Upsert lifetime product aggregates for the items matching `item_filter`"""
+        cursor.execute(f"""
         INSERT INTO products (item_id, first_sale_date, last_sale_date, total_lifetime_sales, total_lifetime_ad_sales, is_currently_eligible)
         SELECT 
             all_items.item_id,
@@ -138,29 +412,173 @@ class EcommerceDataProcessor:
             COALESCE(a.total_ad_sales, 0) as total_lifetime_ad_sales,
             COALESCE(e.is_eligible, 0) as is_currently_eligible
         FROM (
-            SELECT item_id, date FROM daily_sales
+            SELECT item_id, date FROM daily_sales WHERE {item_filter}
             UNION 
-            SELECT item_id, date FROM daily_ad_performance
+            SELECT item_id, date FROM daily_ad_performance WHERE {item_filter}
         ) all_items
-        LEFT JOIN (SELECT item_id, SUM(total_sales) as total_sales FROM daily_sales GROUP BY item_id) s ON all_items.item_id = s.item_id
-        LEFT JOIN (SELECT item_id, SUM(ad_sales) as total_ad_sales FROM daily_ad_performance GROUP BY item_id) a ON all_items.item_id = a.item_id
+        LEFT JOIN (SELECT item_id, SUM(total_sales) as total_sales FROM daily_sales WHERE {item_filter} GROUP BY item_id) s ON all_items.item_id = s.item_id
+        LEFT JOIN (SELECT item_id, SUM(ad_sales) as total_ad_sales FROM daily_ad_performance WHERE {item_filter} GROUP BY item_id) a ON all_items.item_id = a.item_id
         LEFT JOIN product_eligibility e ON all_items.item_id = e.item_id
+        WHERE 1 = 1
         GROUP BY all_items.item_id, s.total_sales, a.total_ad_sales, e.is_eligible
+        ON CONFLICT(item_id) DO UPDATE SET
+            first_sale_date = excluded.first_sale_date,
+            last_sale_date = excluded.last_sale_date,
+            total_lifetime_sales = excluded.total_lifetime_sales,
+            total_lifetime_ad_sales = excluded.total_lifetime_ad_sales,
+            is_currently_eligible = excluded.is_currently_eligible
         """)
         
-        conn.commit()
+    def load_and_transform_data(self):
+        print("Loading data...")
+        
+        conn = self.connect_db()
+        cursor = conn.cursor()
+        analysis = {}
+        started = time.perf_counter()
+        
+        self.begin_bulk_load(conn)
+        cursor.execute("BEGIN")
+        try:
+            for chunk in self.iter_source('total_sales', analysis):
+                self.insert_rows(cursor, 'daily_sales', self.SALES_COLUMNS, chunk)
+            
+            for chunk in self.iter_source('ad_sales', analysis):
+                self.insert_rows(cursor, 'daily_ad_performance', self.AD_COLUMNS, self.add_ad_metrics(chunk))
+            
+            df_eligibility = self.latest_eligibility(self.iter_source('eligibility', analysis))
+            self.insert_rows(cursor, 'product_eligibility', self.ELIGIBILITY_COLUMNS, df_eligibility)
+            
+            # Secondary indexes are built once after the bulk insert rather than maintained per row
+            self.create_indexes(cursor)
+            self.refresh_products(cursor)
+            self.refresh_rollups(cursor)
+            
+            self.bump_load_generation(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.end_bulk_load(conn)
+        
+        self.report_ingest(analysis, time.perf_counter() - started)
         print("Data loaded successfully.")
+        return analysis
+        
+    def create_stage(self, cursor, table, columns):
+        cursor.execute(f"DROP TABLE IF EXISTS temp.staged_{table}")
+        cursor.execute(f"CREATE TEMP TABLE staged_{table} AS SELECT {', '.join(columns)} FROM main.{table} WHERE 0")
+        
+    def upsert_staged(self, cursor, table, key, columns):
+        """Mark items whose rows are new or changed, then upsert only those rows from the staging table"""
+        value_columns = [c for c in columns if c not in key]
+        join = " AND ".join(f"t.{c} = s.{c}" for c in key)
+        changed = " OR ".join(f"t.{c} IS NOT s.{c}" for c in value_columns)
+        cursor.execute(f"""
+        INSERT OR IGNORE INTO temp.touched_items (item_id)
+        SELECT s.item_id FROM temp.staged_{table} s
+        LEFT JOIN main.{table} t ON {join}
+        WHERE t.item_id IS NULL OR {changed}
+        """)
+        if table in self.ROLLUP_SOURCES:
+            cursor.execute(f"""
+            INSERT INTO temp.touched_{table} (date, item_id)
+            SELECT s.date, s.item_id FROM temp.staged_{table} s
+            LEFT JOIN main.{table} t ON {join}
+            WHERE t.item_id IS NULL OR {changed}
+            """)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in value_columns)
+        changed_excluded = " OR ".join(f"{c} IS NOT excluded.{c}" for c in value_columns)
+        cursor.execute(f"""
+        INSERT INTO main.{table} ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM temp.staged_{table} WHERE 1 = 1
+        ON CONFLICT({', '.join(key)}) DO UPDATE SET {updates}
+        WHERE {changed_excluded}
+        """)
+        
+    def load_incremental(self):
+        """Upsert new or changed (date, item_id) rows and refresh products for the touched items only.
+
+        Everything is applied in one transaction, so readers see either the old or the new data.
+        """
+        print("Loading data incrementally...")
+        
+        conn = self.connect_db()
+        cursor = conn.cursor()
+        analysis = {}
+        started = time.perf_counter()
+        
+        self.begin_bulk_load(conn)
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DROP TABLE IF EXISTS temp.touched_items")
+            cursor.execute("CREATE TEMP TABLE touched_items (item_id INTEGER PRIMARY KEY)")
+            for source in self.ROLLUP_SOURCES:
+                cursor.execute(f"DROP TABLE IF EXISTS temp.touched_{source}")
+                cursor.execute(f"CREATE TEMP TABLE touched_{source} (date DATE, item_id INTEGER)")
+            
+            self.create_stage(cursor, 'daily_sales', self.SALES_COLUMNS)
+            for chunk in self.iter_source('total_sales', analysis):
+                self.insert_rows(cursor, 'temp.staged_daily_sales', self.SALES_COLUMNS, chunk)
+            self.upsert_staged(cursor, 'daily_sales', ['date', 'item_id'], self.SALES_COLUMNS)
+            
+            self.create_stage(cursor, 'daily_ad_performance', self.AD_COLUMNS)
+            for chunk in self.iter_source('ad_sales', analysis):
+                self.insert_rows(cursor, 'temp.staged_daily_ad_performance', self.AD_COLUMNS, self.add_ad_metrics(chunk))
+            self.upsert_staged(cursor, 'daily_ad_performance', ['date', 'item_id'], self.AD_COLUMNS)
+            
+            self.create_stage(cursor, 'product_eligibility', self.ELIGIBILITY_COLUMNS)
+            df_eligibility = self.latest_eligibility(self.iter_source('eligibility', analysis))
+            self.insert_rows(cursor, 'temp.staged_product_eligibility', self.ELIGIBILITY_COLUMNS, df_eligibility)
+            self.upsert_staged(cursor, 'product_eligibility', ['item_id'], self.ELIGIBILITY_COLUMNS)
+            
+            touched = cursor.execute("SELECT COUNT(*) FROM temp.touched_items").fetchone()[0]
+            if touched:
+                self.refresh_products(cursor, "item_id IN (SELECT item_id FROM temp.touched_items)")
+                self.bump_load_generation(conn)
+            self.refresh_rollups(cursor, incremental=True)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.end_bulk_load(conn)
+        
+        self.report_ingest(analysis, time.perf_counter() - started)
+        print(f"Incremental load complete: {touched} items touched.")
+        return touched
+        
+    def bump_load_generation(self, conn):
+        """Advance PRAGMA user_version so agents drop results cached against older data"""
+        generation = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.execute(f"PRAGMA user_version = {int(generation) + 1}")
         
     def run_full_pipeline(self):
         print("Starting data processing...")
         
-        analysis = self.analyze_csv_files()
         self.create_optimized_tables()
-        self.load_and_transform_data()
+        analysis = self.load_and_transform_data()
+        if self.snapshot_dir:
+            self.export_snapshot()
         
         print("Database ready for AI agent.")
         return analysis
+        
+    def run_incremental_pipeline(self):
+        print("Starting incremental data processing...")
+        
+        self.ensure_tables()
+        touched = self.load_incremental()
+        if self.snapshot_dir:
+            self.export_snapshot()
+        
+        print("Database ready for AI agent.")
+        return touched
 
 if __name__ == "__main__":
-    processor = EcommerceDataProcessor()
-    processor.run_full_pipeline()
+    processor = EcommerceDataProcessor(snapshot_dir=os.getenv("COLUMNAR_SNAPSHOT_DIR") or None)
+    if "--incremental" in sys.argv:
+        processor.run_incremental_pipeline()
+    else:
+        processor.run_full_pipeline()
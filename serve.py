@@ -0,0 +1,140 @@
+"""Run the API on several worker processes that share one listening socket.
+
+The supervisor binds the port and imports the heavy libraries once, then forks
+the workers so those pages are shared copy-on-write. Each worker builds its
+own agent (SQLite connections and threads don't survive a fork), starts
+accepting connections at once and reports ready on /health/ready once warm, and
+they share cached SQL and results through SHARED_CACHE_PATH (by default a file
+next to the database when there is more than one worker). Crashed workers
+are replaced. Without fork (Windows) this falls back to uvicorn's own
+multi-process mode.
+
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import importlib
+import os
+import secrets
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+from dotenv import load_dotenv
+
+# Imported before forking so workers share them instead of loading them each; the app itself
+# defers the LLM and chart stacks, so they are listed here explicitly
+PRELOAD = ["numpy", "pandas", "fastapi", "pydantic", "sqlalchemy", "langchain_core.prompts", "langchain_groq",
+           "matplotlib.pyplot", "seaborn", "core.llm"]
+
+
+def preload():
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"⚠️  WARNING: not preloading {name}: {e}")
+
+
+def bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, log_level):
+    import api  # builds this worker's agent; the app's lifespan warms it in the background while serving
+
+    config = uvicorn.Config(api.app, log_level=log_level, timeout_graceful_shutdown=10)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock, log_level):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(sock, log_level)
+        except BaseException as e:
+            print(f"⚠️  WARNING: worker {os.getpid()} failed: {e}", file=sys.stderr)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def supervise(sock, workers, log_level):
+    children = {spawn(sock, log_level) for _ in range(workers)}
+    print(f"Serving on {sock.getsockname()[:2]} with {workers} workers: {sorted(children)}")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    last_respawn = 0.0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if stopping:
+            continue
+        print(f"⚠️  WARNING: worker {pid} exited with status {status}; starting a replacement")
+        # don't spin if workers die on start-up (e.g. a missing database)
+        time.sleep(max(0.0, 1.0 - (time.monotonic() - last_respawn)))
+        last_respawn = time.monotonic()
+        children.add(spawn(sock, log_level))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "0")) or os.cpu_count(),
+                        help="worker processes (default: API_WORKERS or one per CPU)")
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--no-shared-cache", action="store_true",
+                        help="give every worker its own cache instead of the default shared file")
+    args = parser.parse_args()
+
+    # every worker must accept the page tokens the others sign
+    os.environ.setdefault("PAGE_TOKEN_SECRET", secrets.token_hex(32))
+    # workers share cached SQL and results through a file next to the database unless told otherwise
+    # (an empty SHARED_CACHE_PATH or --no-shared-cache)
+    if args.no_shared_cache:
+        os.environ["SHARED_CACHE_PATH"] = ""
+    elif "SHARED_CACHE_PATH" not in os.environ and args.workers > 1:
+        database = os.getenv("DATABASE_PATH", "ecommerce_optimized.db")
+        os.environ["SHARED_CACHE_PATH"] = f"{os.path.splitext(database)[0]}_shared_cache.db"
+    if not os.getenv("SHARED_CACHE_PATH") and args.workers > 1:
+        print("⚠️  WARNING: shared cache disabled; every worker keeps its own cold cache")
+
+    if not hasattr(os, "fork"):
+        uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+        return
+
+    sock = bind(args.host, args.port)
+    preload()
+    supervise(sock, args.workers, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
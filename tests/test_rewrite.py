@@ -0,0 +1,41 @@
+import pytest
+
+from core.rewrite import RollupRewriter
+from data.processor import EcommerceDataProcessor
+
+
+@pytest.fixture
+def conn(tmp_path):
+    processor = EcommerceDataProcessor(db_name=str(tmp_path / "rollups.db"))
+    processor.create_optimized_tables()
+    conn = processor.connect_db()
+    # Daily rows that pass a HAVING on the per-month sum but not on any single day
+    rows = [(f"2025-06-{day:02d}", item, 3000.0 * item, day) for item in range(1, 6) for day in range(1, 29)]
+    conn.executemany("INSERT INTO daily_sales (date, item_id, total_sales, total_units_ordered) VALUES (?, ?, ?, ?)", rows)
+    processor.refresh_rollups(conn.cursor())
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def fetch(conn, sql_query):
+    return sorted(conn.execute(sql_query).fetchall())
+
+
+def test_alias_shadowing_a_column_is_not_rewritten(conn):
+    sql_query = ("SELECT item_id, SUM(total_sales) AS total_sales FROM daily_sales "
+                 "GROUP BY item_id HAVING total_sales > 10000 ORDER BY item_id")
+    monthly = sql_query.replace("FROM daily_sales", "FROM daily_sales_monthly")
+    # On the rollup the bare column holds monthly sums, so the same statement keeps different rows
+    assert fetch(conn, sql_query) != fetch(conn, monthly)
+
+    assert RollupRewriter().rewrite(sql_query, conn, (1, 0)) == sql_query
+
+
+def test_distinct_alias_is_rewritten_with_the_same_results(conn):
+    sql_query = ("SELECT item_id, SUM(total_sales) AS sales FROM daily_sales "
+                 "GROUP BY item_id HAVING sales > 10000 ORDER BY sales DESC")
+    rewritten = RollupRewriter().rewrite(sql_query, conn, (1, 0))
+
+    assert "daily_sales_monthly" in rewritten or "daily_sales_weekly" in rewritten
+    assert fetch(conn, rewritten) == fetch(conn, sql_query)
@@ -1,6 +1,10 @@
 import streamlit as st
+import pandas as pd
 import time
 
+# While rows stream in, the table is redrawn at most this often (concatenating every chunk is O(rows))
+TABLE_REFRESH_S = 0.5
+
 def setup_page_config():
     st.set_page_config(
         page_title="E-commerce AI Analytics",
@@ -68,57 +72,89 @@ def create_search_interface():
     
     return search_query, search_button
 
-def stream_text(text, placeholder):
-    displayed_text = ""
-    for char in text:
-        displayed_text += char
-        placeholder.markdown(displayed_text)
-        time.sleep(0.02)
-
-def display_results(result, search_query, search_button, explanation_func, viz_func):
+def stream_results(events, search_query, viz_func, chart_cache=None):
+    """Render agent.stream_answer events as they arrive; returns the final result or error dict"""
     response_placeholder = st.empty()
+    response_placeholder.markdown("_Writing the SQL query..._")
+    with st.expander("🔍 View Generated SQL Query", expanded=True):
+        sql_placeholder = st.empty()
+    heading_placeholder = st.empty()
+    table_placeholder = st.empty()
+    
+    sql_parts, frames, result, refreshed = [], [], None, None
+    for event, payload in events:
+        if event == 'sql_token':
+            sql_parts.append(payload)
+            sql_placeholder.code("".join(sql_parts), language='sql')
+        elif event == 'sql':
+            sql_placeholder.code(payload, language='sql')
+            response_placeholder.markdown("_Running the query..._")
+        elif event == 'rows':
+            frames.append(payload)
+            if refreshed is None or time.monotonic() - refreshed >= TABLE_REFRESH_S:
+                if refreshed is None:
+                    heading_placeholder.markdown("#### 📋 Results")
+                table_placeholder.dataframe(pd.concat(frames, ignore_index=True) if len(frames) > 1 else payload,
+                                            use_container_width=True, hide_index=True)
+                refreshed = time.monotonic()
+        elif event == 'explanation':
+            response_placeholder.markdown(payload)
+        elif event == 'error':
+            response_placeholder.empty()
+            return payload
+        elif event == 'done':
+            result = payload
+            # The final result already holds every row shown, so the last chunks need no concat
+            if frames:
+                table_placeholder.dataframe(result['results'], use_container_width=True, hide_index=True)
     
+    if result is None or result['results'].empty:
+        response_placeholder.markdown("No results found. Try a different query.")
+        return result or {'error': "The query did not finish"}
+    if result.get('truncated'):
+        st.warning(result['reason']['message'])
+    show_visualization(result['results'], viz_func, chart_cache)
+    return result
+
+def display_results(result, search_query, explanation_func, viz_func, chart_cache=None):
     if result.get('results') is not None and not result['results'].empty:
         df = result['results']
-        explanation = explanation_func(df, search_query)
-        
-        if search_button or 'last_streamed_query' not in st.session_state or st.session_state.last_streamed_query != search_query:
-            stream_text(explanation, response_placeholder)
-            st.session_state.last_streamed_query = search_query
-        else:
-            response_placeholder.markdown(explanation)
+        st.markdown(result.get('explanation') or explanation_func(df, search_query))
         
         with st.expander("🔍 View Generated SQL Query"):
             st.code(result['sql'], language='sql')
         
         st.markdown("#### 📋 Results")
         st.dataframe(df, use_container_width=True, hide_index=True)
+        if result.get('truncated'):
+            st.warning(result['reason']['message'])
+        show_visualization(df, viz_func, chart_cache)
+    
+    else:
+        st.markdown("No results found. Try a different query.")
+
+def show_visualization(df, viz_func, chart_cache=None):
+    viz_options = viz_func.get_visualization_options(df)
+    
+    if viz_options:
+        st.markdown("#### 📊 Visualization")
         
-        viz_options = viz_func.get_visualization_options(df)
+        col_viz, col_empty = st.columns([2, 3])
         
-        if viz_options:
-            st.markdown("#### 📊 Visualization")
-            
-            col_viz, col_empty = st.columns([2, 3])
-            
-            with col_viz:
-                selected_viz = st.selectbox(
-                    "Choose visualization type:",
-                    options=viz_options,
-                    index=0,
-                    key="viz_selector"
-                )
-            
-            if selected_viz:
-                chart = viz_func.create_visualization(df, selected_viz)
-                if chart:
-                    st.pyplot(chart, use_container_width=True)
-                    import matplotlib.pyplot as plt
-                    plt.close(chart)
-                else:
-                    st.info(f"Unable to create {selected_viz}.")
-        else:
-            st.info("This data is best displayed in table format.")
-    
+        with col_viz:
+            selected_viz = st.selectbox(
+                "Choose visualization type:",
+                options=viz_options,
+                index=0,
+                key="viz_selector"
+            )
+        
+        if selected_viz:
+            # Reruns with the same results reuse the cached PNG instead of redrawing the figure
+            _, chart = viz_func.render_chart(df, selected_viz, "png", chart_cache)
+            if chart:
+                st.image(chart, use_container_width=True)
+            else:
+                st.info(f"Unable to create {selected_viz}.")
     else:
-        stream_text("No results found. Try a different query.", response_placeholder)
+        st.info("This data is best displayed in table format.")
@@ -1,16 +1,23 @@
+from utils.stats import SummaryStats
+
 def generate_explanation(df, search_query):
     if df.empty:
         return "No data found for your query."
+    return explain_summary(SummaryStats.from_frame(df), search_query)
+
+def explain_summary(stats, search_query):
+    """Same text as generate_explanation, from statistics accumulated over result chunks"""
+    if not stats.row_count or not stats.columns:
+        return "No data found for your query."
 
-    row_count = len(df)
-    col_count = len(df.columns)
-    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    text_cols = df.select_dtypes(include=['object']).columns.tolist()
+    row_count = stats.row_count
+    numeric_cols = stats.numeric_columns()
+    text_cols = stats.text_columns()
 
     if row_count == 1:
-        row = df.iloc[0]
+        row = stats.first_row.iloc[0]
         details = []
-        for col in df.columns:
+        for col in stats.columns:
             val = row[col]
             if col in numeric_cols:
                 details.append(f"{col.replace('_',' ').title()}: {val:,.2f}")
@@ -18,15 +25,15 @@ def generate_explanation(df, search_query):
                 details.append(f"{col.replace('_',' ').title()}: {val}")
         return f"Here are the details: {', '.join(details)}."
     elif row_count > 1:
-    
+
         summary = []
         if numeric_cols:
             for col in numeric_cols:
-                col_data = df[col]
-                summary.append(f"{col.replace('_',' ').title()} (min: {col_data.min():,.2f}, max: {col_data.max():,.2f}, avg: {col_data.mean():,.2f})")
+                low, high, mean = stats.summary(col)
+                summary.append(f"{col.replace('_',' ').title()} (min: {low:,.2f}, max: {high:,.2f}, avg: {mean:,.2f})")
         if text_cols:
             for col in text_cols:
-                unique_vals = df[col].nunique()
+                unique_vals = stats.unique_count(col)
                 summary.append(f"{col.replace('_',' ').title()} ({unique_vals} unique values)")
         if summary:
             return f"Found {row_count} records. Key stats: {', '.join(summary)}."
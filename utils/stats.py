@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+
+def column_kind(series):
+    """'number' and 'text' match generate_explanation's select_dtypes split; anything else is not summarized"""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'other'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'number'
+    if dtype == object:
+        # an all-NULL chunk comes back as object; let the other chunks decide the column's kind
+        return 'text' if series.notna().any() else None
+    if pd.api.types.is_string_dtype(dtype):
+        return 'text'
+    return 'other'
+
+
+def reduce_block(block):
+    """(min, max, float sum, non-null count) arrays for same-dtype columns, one reduction each over the 2D block"""
+    values = block.to_numpy()
+    if not isinstance(block.dtypes.iloc[0], np.dtype):
+        # nullable extension dtypes: let pandas skip the NAs
+        return (block.min().to_numpy(), block.max().to_numpy(),
+                block.sum().to_numpy(dtype=np.float64), block.count().to_numpy())
+    if values.dtype.kind == 'f':
+        missing = np.isnan(values)
+        return (np.fmin.reduce(values, axis=0), np.fmax.reduce(values, axis=0),
+                np.where(missing, 0.0, values).sum(axis=0), values.shape[0] - missing.sum(axis=0))
+    # ints from SQLite have no NULLs (those come back as float columns); sum as float like pandas' mean
+    return (values.min(axis=0), values.max(axis=0),
+            values.sum(axis=0, dtype=np.float64), np.full(values.shape[1], values.shape[0]))
+
+
+class SummaryStats:
+    """Per-column summaries for explanations, accumulated one result chunk at a time.
+
+    Numeric columns keep min, max, sum and count of non-null values, text columns
+    the distinct non-null values of each chunk, so a streamed result never has to be held
+    as one DataFrame. Each chunk is reduced in a single vectorized pass per kind.
+    A column that mixes numbers and text across chunks is summarized as text
+    from its text chunks only.
+    """
+
+    def __init__(self):
+        self.columns = None
+        self.row_count = 0
+        self.first_row = None
+        self.kinds = {}
+        self.numeric = {}
+        self.distinct = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        stats = cls()
+        stats.update(df)
+        return stats
+
+    def update_rows(self, columns, rows):
+        """Feed a (columns, rows) chunk as yielded by EcommerceAIAgent.iter_rows"""
+        if rows:
+            self.update(pd.DataFrame.from_records(rows, columns=columns, coerce_float=True))
+
+    def update(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.kinds = {col: None for col in self.columns}
+        if chunk.empty:
+            return
+        if self.first_row is None:
+            self.first_row = chunk.iloc[:1]
+        self.row_count += len(chunk)
+
+        numeric_cols, text_cols = [], []
+        for col in self.columns:
+            kind = column_kind(chunk[col])
+            if kind is None:
+                continue
+            current = self.kinds[col]
+            # a column whose chunks disagree ends up object dtype in the full result, i.e. text
+            self.kinds[col] = kind if current in (None, kind) else 'text'
+            if kind == 'number':
+                numeric_cols.append(col)
+            elif kind == 'text':
+                text_cols.append(col)
+
+        by_dtype = {}
+        for col in numeric_cols:
+            by_dtype.setdefault(chunk[col].dtype, []).append(col)
+        for cols in by_dtype.values():
+            for col, low, high, total, count in zip(cols, *reduce_block(chunk[cols])):
+                if not count:
+                    continue
+                previous = self.numeric.get(col)
+                if previous is None:
+                    self.numeric[col] = [low, high, total, count]
+                else:
+                    self.numeric[col] = [min(previous[0], low), max(previous[1], high),
+                                         previous[2] + total, previous[3] + count]
+        for col in text_cols:
+            uniques = chunk[col].unique()
+            self.distinct.setdefault(col, []).append(uniques[~pd.isna(uniques)])
+
+    def numeric_columns(self):
+        return [col for col in self.columns or [] if self.kinds[col] == 'number']
+
+    def text_columns(self):
+        # columns that were NULL in every chunk are object dtype, i.e. text with no values
+        return [col for col in self.columns or [] if self.kinds[col] in ('text', None)]
+
+    def summary(self, col):
+        """(min, max, mean) of a numeric column; NaN when it has no values"""
+        if col not in self.numeric:
+            return float('nan'), float('nan'), float('nan')
+        low, high, total, count = self.numeric[col]
+        return low, high, total / count
+
+    def unique_count(self, col):
+        chunks = self.distinct.get(col, [])
+        if len(chunks) == 1:
+            return len(chunks[0])
+        return len(set().union(*chunks))
@@ -1,91 +1,161 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
+import hashlib
+import io
+import threading
 import numpy as np
+import pandas as pd
+
+# matplotlib and seaborn take about a second to import, so they load with the first chart
+# rather than in every process that imports this module (e.g. API workers that never draw)
+
+# Charts never draw more rows than this, so large results are cut down before hashing and plotting
+BAR_CHART_ROWS = 15
+PIE_CHART_ROWS = 8
+
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+_style_lock = threading.Lock()
+_style_ready = False
+# Font and text layout caches in matplotlib are not thread-safe; the API renders from worker threads
+_render_lock = threading.Lock()
 
 def setup_plot_style():
-    plt.style.use('dark_background')
-    sns.set_palette("husl")
-    plt.rcParams['figure.facecolor'] = '#0E1117'
-    plt.rcParams['axes.facecolor'] = '#0E1117'
-    plt.rcParams['text.color'] = 'white'
-    plt.rcParams['axes.labelcolor'] = 'white'
-    plt.rcParams['xtick.color'] = 'white'
-    plt.rcParams['ytick.color'] = 'white'
+    global _style_ready
+    with _style_lock:
+        if _style_ready:
+            return
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        plt.style.use('dark_background')
+        sns.set_palette("husl")
+        plt.rcParams['figure.facecolor'] = '#0E1117'
+        plt.rcParams['axes.facecolor'] = '#0E1117'
+        plt.rcParams['text.color'] = 'white'
+        plt.rcParams['axes.labelcolor'] = 'white'
+        plt.rcParams['xtick.color'] = 'white'
+        plt.rcParams['ytick.color'] = 'white'
+        _style_ready = True
 
-def create_visualization(df, viz_type):
-    if df.empty or len(df) <= 1:
-        return None
-    
+def main_metric(df):
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
     numeric_cols = [col for col in numeric_cols if 'id' not in col.lower()]
-    
-    if not numeric_cols:
+    return numeric_cols[0] if numeric_cols else None
+
+def plot_data(df, viz_type):
+    """The rows and columns `viz_type` actually draws from `df`, or None if that chart does not apply"""
+    if df.empty or len(df) <= 1 or 'item_id' not in df.columns:
+        return None
+    metric = main_metric(df)
+    if metric is None:
+        return None
+    if viz_type == "Bar Chart":
+        return df[['item_id', metric]].head(BAR_CHART_ROWS)
+    if viz_type == "Pie Chart" and len(df) <= 10:
+        return df[['item_id', metric]].head(PIE_CHART_ROWS)
+    return None
+
+def chart_key(data, viz_type, fmt):
+    """Content hash of the plotted rows plus chart type and format"""
+    digest = hashlib.sha256()
+    digest.update(repr((list(data.columns), [str(t) for t in data.dtypes], viz_type, fmt)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def draw_chart(data, viz_type):
+    setup_plot_style()
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    main_metric = data.columns[1]
+    # A bare Figure stays out of pyplot's global figure list, so threads don't share state
+    fig = Figure(figsize=(12, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    fig.patch.set_facecolor('#0E1117')
+    ax.set_facecolor('#0E1117')
+
+    if viz_type == "Bar Chart":
+        bars = ax.bar(data['item_id'].astype(str), data[main_metric],
+                     color=plt.cm.viridis(np.linspace(0, 1, len(data))),
+                     edgecolor='white', linewidth=0.8, alpha=0.9)
+
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height,
+                   f'{height:,.0f}', ha='center', va='bottom',
+                   fontsize=10, color='white', fontweight='bold')
+
+        ax.set_xlabel('Product ID', fontsize=12, fontweight='bold')
+        ax.set_ylabel(main_metric.replace('_', ' ').title(), fontsize=12, fontweight='bold')
+        ax.set_title(f'{main_metric.replace("_", " ").title()} by Product',
+                    fontsize=16, fontweight='bold', pad=20)
+        ax.tick_params(axis='x', labelrotation=45)
+
+    else:
+        colors = plt.cm.Set3(np.linspace(0, 1, len(data)))
+        ax.pie(data[main_metric],
+              labels=[f'Product {x}' for x in data['item_id']],
+              autopct='%1.1f%%',
+              colors=colors,
+              startangle=90,
+              textprops={'fontsize': 10, 'color': 'white'})
+
+        ax.set_title(f'Distribution of {main_metric.replace("_", " ").title()}',
+                    fontsize=16, fontweight='bold', pad=20)
+
+    fig.tight_layout()
+    return fig
+
+def create_visualization(df, viz_type):
+    data = plot_data(df, viz_type)
+    if data is None:
         return None
-    
-    main_metric = numeric_cols[0]
-    
     try:
-        setup_plot_style()
-        fig, ax = plt.subplots(figsize=(12, 8))
-        fig.patch.set_facecolor('#0E1117')
-        ax.set_facecolor('#0E1117')
-        
-        if viz_type == "Bar Chart" and 'item_id' in df.columns:
-            data = df.head(15).copy()
-            bars = ax.bar(data['item_id'].astype(str), data[main_metric], 
-                         color=plt.cm.viridis(np.linspace(0, 1, len(data))),
-                         edgecolor='white', linewidth=0.8, alpha=0.9)
-            
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                       f'{height:,.0f}', ha='center', va='bottom',
-                       fontsize=10, color='white', fontweight='bold')
-            
-            ax.set_xlabel('Product ID', fontsize=12, fontweight='bold')
-            ax.set_ylabel(main_metric.replace('_', ' ').title(), fontsize=12, fontweight='bold')
-            ax.set_title(f'{main_metric.replace("_", " ").title()} by Product', 
-                        fontsize=16, fontweight='bold', pad=20)
-            plt.xticks(rotation=45)
-            
-        elif viz_type == "Pie Chart" and len(df) <= 10:
-            data = df.head(8).copy()
-            colors = plt.cm.Set3(np.linspace(0, 1, len(data)))
-            ax.pie(data[main_metric], 
-                  labels=[f'Product {x}' for x in data['item_id']], 
-                  autopct='%1.1f%%',
-                  colors=colors,
-                  startangle=90,
-                  textprops={'fontsize': 10, 'color': 'white'})
-            
-            ax.set_title(f'Distribution of {main_metric.replace("_", " ").title()}', 
-                        fontsize=16, fontweight='bold', pad=20)
-            
-        else:
-            plt.close(fig)
-            return None
-        
-        plt.tight_layout()
-        return fig
-        
+        with _render_lock:
+            return draw_chart(data, viz_type)
     except Exception as e:
-        plt.close(fig)
         return None
 
+def render_chart(df, viz_type, fmt="png", cache=None):
+    """Return (key, image bytes) for the chart, reusing `cache` for identical plotted data; (None, None) if it does not apply"""
+    data = plot_data(df, viz_type)
+    if data is None or fmt not in CHART_FORMATS:
+        return None, None
+    key = chart_key(data, viz_type, fmt)
+    if cache is not None:
+        image = cache.get(key)
+        if image is not None:
+            return key, image
+
+    try:
+        with _render_lock:
+            fig = draw_chart(data, viz_type)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=fmt, facecolor=fig.get_facecolor())
+    except Exception as e:
+        return None, None
+    image = buffer.getvalue()
+    if cache is not None:
+        cache.set(key, image)
+    return key, image
+
+def warmup_charts():
+    """Import the chart stack and draw one throwaway chart so fonts and the renderer are loaded"""
+    render_chart(pd.DataFrame({'item_id': [1, 2], 'total_sales': [1.0, 2.0]}), "Bar Chart")
+
 def get_visualization_options(df):
     if df.empty or len(df) <= 1:
         return []
-    
+
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
     if not numeric_cols:
         return []
-    
+
     options = []
-    
+
     if len(df) > 1:
         options.append("Bar Chart")
-    
+
     if 2 <= len(df) <= 10:
         options.append("Pie Chart")
-    
+
     return options